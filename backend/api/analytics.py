@@ -0,0 +1,138 @@
+import atexit
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from api.cache import bump_version, get_version
+from recipes.models import Recipe, RecipeStats
+
+FLUSH_VERSION = 'stats:flush'
+POLL_INTERVAL = 1
+FIELDS = ('clicks', 'views')
+
+
+class StatsBuffer:
+    """
+    Буфер счётчиков переходов и просмотров рецептов в памяти процесса.
+
+    Приращения суммируются и записываются одним многострочным upsert:
+    каждые STATS_FLUSH_INTERVAL секунд, после STATS_FLUSH_SIZE событий,
+    при завершении процесса и по запросу команды flush_recipe_stats.
+    Запись всегда идёт в фоновом потоке, а не в потоке запроса.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._events = 0
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        self._flush_version = None
+        self._thread = None
+        self._wake = threading.Event()
+
+    def add(self, recipe_id, field):
+        with self._lock:
+            self._counts[recipe_id, field] += 1
+            self._events += 1
+            if self._thread is None:
+                self._start()
+            if self._events >= settings.STATS_FLUSH_SIZE:
+                self._wake.set()
+
+    def pending(self, recipe_id):
+        """Ещё не записанные приращения рецепта."""
+        with self._lock:
+            return {
+                field: self._counts[recipe_id, field] for field in FIELDS
+            }
+
+    def _start(self):
+        self._flush_version = get_version(FLUSH_VERSION)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self._flush_quietly)
+
+    def _run(self):
+        while True:
+            full = self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            version = get_version(FLUSH_VERSION)
+            due = (
+                time.monotonic() - self._flushed_at
+                >= settings.STATS_FLUSH_INTERVAL
+            )
+            if full or due or version != self._flush_version:
+                self._flush_version = version
+                self._flush_quietly()
+                connection.close()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except DatabaseError:
+            pass
+
+    def flush(self):
+        """Записывает накопленные приращения, при ошибке возвращает их."""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._events = 0
+            self._flushed_at = time.monotonic()
+        if not counts:
+            return 0
+
+        rows = {}
+        for (recipe_id, field), count in counts.items():
+            rows.setdefault(recipe_id, dict.fromkeys(FIELDS, 0))[field] = count
+        try:
+            write_stats(rows)
+        except DatabaseError:
+            with self._lock:
+                self._counts.update(counts)
+            raise
+        return len(rows)
+
+
+def write_stats(rows):
+    """
+    Прибавляет счётчики одним INSERT ... ON CONFLICT DO UPDATE.
+
+    rows — словарь {id рецепта: {поле: приращение}}; строки удалённых
+    рецептов пропускаются.
+    """
+    quote = connection.ops.quote_name
+    table = quote(RecipeStats._meta.db_table)
+    key = quote(RecipeStats._meta.pk.column)
+    columns = ', '.join(quote(field) for field in FIELDS)
+    select = 'SELECT {} FROM {} WHERE {} = %s'.format(
+        ', '.join(['%s'] * (len(FIELDS) + 1)),
+        quote(Recipe._meta.db_table),
+        quote(Recipe._meta.pk.column)
+    )
+    updates = ', '.join(
+        f'{quote(field)} = {table}.{quote(field)} + EXCLUDED.{quote(field)}'
+        for field in FIELDS
+    )
+    params = []
+    for recipe_id, counts in rows.items():
+        params.extend([recipe_id, *(counts[field] for field in FIELDS)])
+        params.append(recipe_id)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({key}, {columns}) '
+            f'{" UNION ALL ".join([select] * len(rows))} '
+            f'ON CONFLICT ({key}) DO UPDATE SET {updates}',
+            params
+        )
+
+
+def request_flush():
+    """Просит все процессы записать свои буферы."""
+    bump_version(FLUSH_VERSION)
+
+
+recipe_stats = StatsBuffer()
@@ -0,0 +1,30 @@
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию с синтетическими данными замера."""
+
+
+@contextmanager
+def rolled_back():
+    """Выполняет блок в транзакции, которая затем откатывается."""
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def timings(func, repeat):
+    """Медиана и минимум времени выполнения func в миллисекундах."""
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        results.append((time.perf_counter() - start) * 1000)
+    return statistics.median(results), min(results)
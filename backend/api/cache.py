@@ -0,0 +1,98 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+VERSION_KEY = 'version:{}'
+RECIPE_KEY = 'recipe:{}:{}:{}'
+FOLLOWS_KEY = 'follows:{}:{}'
+RECIPE_RENDER_VERSION = 2
+
+
+def get_version(name):
+    """Текущая версия именованного набора данных."""
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """
+    Обновляет версию, делая недействительными зависимые ключи.
+
+    Версия — отметка времени в наносекундах, поэтому её можно
+    использовать и как время последнего изменения.
+    """
+    version = time.time_ns()
+    cache.set(VERSION_KEY.format(name), version, None)
+    return version
+
+
+def model_version_name(model):
+    """Имя версии для списка объектов модели."""
+    return f'model:{model._meta.label_lower}'
+
+
+def user_version_name(user_id):
+    """Имя версии для персональных списков пользователя."""
+    return f'user:{user_id}'
+
+
+def get_followed_authors(user):
+    """Множество id авторов, на которых подписан пользователь."""
+    key = FOLLOWS_KEY.format(
+        user.pk, get_version(user_version_name(user.pk))
+    )
+    authors = cache.get(key)
+    if authors is None:
+        authors = frozenset(
+            user.follower.values_list('author_id', flat=True)
+        )
+        cache.set(key, authors, settings.RECIPE_CACHE_TTL)
+    return authors
+
+
+def recipe_cache_key(recipe):
+    """
+    Ключ общего для всех пользователей представления рецепта.
+
+    Ключ включает дату изменения рецепта: после её обновления старое
+    представление больше не читается, даже если его записал запрос,
+    прочитавший рецепт до коммита изменения.
+    """
+    updated = recipe.updated
+    return RECIPE_KEY.format(
+        RECIPE_RENDER_VERSION, recipe.id,
+        f'{int(updated.timestamp())}{updated.microsecond:06d}'
+    )
+
+
+def get_rendered_recipes(recipes):
+    """Закэшированные представления рецептов, словарь по id."""
+    keys = {recipe.id: recipe_cache_key(recipe) for recipe in recipes}
+    cached = cache.get_many(list(keys.values()))
+    return {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+
+def set_rendered_recipes(recipes, representations):
+    """Сохраняет представления рецептов, переданные словарём по id."""
+    cache.set_many(
+        {
+            recipe_cache_key(recipe): representations[recipe.id]
+            for recipe in recipes
+        },
+        settings.RECIPE_CACHE_TTL
+    )
+
+
+def touch_recipes(recipes):
+    """
+    Обновляет дату изменения рецептов из queryset.
+
+    Новая дата меняет ключи кэша представлений и ETag рецептов.
+    """
+    return recipes.update(updated=timezone.now())
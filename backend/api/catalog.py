@@ -0,0 +1,327 @@
+import gzip
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict, namedtuple
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import get_version, model_version_name
+from constant import INGREDIENT_SEARCH_LIMIT
+from recipes.models import Ingredient, Tag
+
+TAG_FIELDS = ('id', 'name', 'slug')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit')
+NON_WORD = re.compile(r'[\W_]+')
+TRIGRAM_THRESHOLD = 0.5
+
+ACCEPTS_GZIP = _lazy_re_compile(r'\bgzip\b')
+
+IndexState = namedtuple(
+    'IndexState', ('version', 'keys', 'rows', 'words', 'postings')
+)
+RenderedState = namedtuple('RenderedState', ('version', 'identity', 'gzip'))
+
+
+class TagCatalog:
+    """
+    Каталог тегов в памяти процесса.
+
+    Перечитывается из базы, когда меняется общая версия каталога,
+    поэтому изменения видны во всех воркерах.
+    """
+
+    def __init__(self):
+        self._version = None
+        self._tags = []
+        self._tags_by_id = {}
+        self._ids_by_slug = {}
+
+    def refresh(self):
+        version = get_version(model_version_name(Tag))
+        if version != self._version:
+            tags = list(Tag.objects.values(*TAG_FIELDS))
+            self._tags_by_id = {tag['id']: tag for tag in tags}
+            self._ids_by_slug = {tag['slug']: tag['id'] for tag in tags}
+            self._tags = tags
+            self._version = version
+
+    def all(self):
+        """Все теги в порядке id."""
+        self.refresh()
+        return self._tags
+
+    def get(self, pk):
+        """Тег по id или None."""
+        self.refresh()
+        try:
+            return self._tags_by_id.get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def get_many(self, ids):
+        """Теги по списку id в порядке id."""
+        self.refresh()
+        return [
+            self._tags_by_id[pk] for pk in sorted(ids)
+            if pk in self._tags_by_id
+        ]
+
+    def in_bulk(self, ids):
+        """Объекты Tag по списку id, как QuerySet.in_bulk."""
+        return {
+            tag['id']: Tag.from_db(
+                DEFAULT_DB_ALIAS, TAG_FIELDS,
+                [tag[field] for field in TAG_FIELDS]
+            )
+            for tag in self.get_many(ids)
+        }
+
+    def slugs(self):
+        """Слаги всех тегов."""
+        self.refresh()
+        return list(self._ids_by_slug)
+
+    def ids_for_slugs(self, slugs):
+        """id тегов по списку слагов, неизвестные слаги пропускаются."""
+        self.refresh()
+        return [
+            self._ids_by_slug[slug]
+            for slug in slugs
+            if slug in self._ids_by_slug
+        ]
+
+
+tag_catalog = TagCatalog()
+
+
+class IngredientIndex:
+    """
+    Поисковый индекс ингредиентов в памяти процесса.
+
+    Названия приводятся к casefold, что корректно работает и для
+    кириллицы, и хранятся в отсортированном массиве: поиск по префиксу
+    сводится к двум бинарным поискам. Для поиска по подстроке и с
+    опечатками строится индекс триграмм слов, как в pg_trgm.
+
+    Пока индекс устарел, методы поиска возвращают None, а перестроение
+    идёт в фоновом потоке.
+    """
+
+    def __init__(self):
+        self._state = IndexState(None, [], [], [], {})
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(value):
+        return unicodedata.normalize('NFC', value).casefold()
+
+    @staticmethod
+    def words(value):
+        """Строка из слов значения, каждое с ведущим пробелом."""
+        return ' ' + ' '.join(NON_WORD.sub(' ', value).split())
+
+    @classmethod
+    def trigrams(cls, value):
+        """Множество триграмм слов строки."""
+        trigrams = set()
+        for word in cls.words(value).split():
+            padded = f'  {word} '
+            trigrams.update(
+                padded[i:i + 3] for i in range(len(padded) - 2)
+            )
+        return trigrams
+
+    def build(self, version=None):
+        if version is None:
+            version = get_version(model_version_name(Ingredient))
+
+        rows = sorted(
+            Ingredient.objects.values(*INGREDIENT_FIELDS),
+            key=lambda row: (self.normalize(row['name']), row['id'])
+        )
+        keys = [self.normalize(row['name']) for row in rows]
+        postings = defaultdict(list)
+        for position, key in enumerate(keys):
+            for trigram in self.trigrams(key):
+                postings[trigram].append(position)
+
+        self._state = IndexState(
+            version, keys, rows, [self.words(key) for key in keys],
+            dict(postings)
+        )
+
+    def is_fresh(self):
+        version = get_version(model_version_name(Ingredient))
+        if version == self._state.version:
+            return True
+
+        if self._lock.acquire(blocking=False):
+            threading.Thread(
+                target=self._rebuild, args=(version,), daemon=True
+            ).start()
+        return False
+
+    def _rebuild(self, version):
+        try:
+            self.build(version)
+        except DatabaseError:
+            pass
+        finally:
+            connection.close()
+            self._lock.release()
+
+    def startswith(self, prefix):
+        """Ингредиенты, название которых начинается с prefix."""
+        if not self.is_fresh():
+            return None
+
+        state = self._state
+        if not prefix:
+            return state.rows
+
+        start, end = self._prefix_range(state, self.normalize(prefix))
+        return state.rows[start:end]
+
+    def search(self, query, limit=INGREDIENT_SEARCH_LIMIT):
+        """
+        Ранжированный поиск не более чем limit ингредиентов.
+
+        Сначала идут совпадения по началу названия, затем по началу
+        слова, затем по подстроке и, наконец, похожие по триграммам.
+        """
+        if not self.is_fresh():
+            return None
+
+        state = self._state
+        query = self.normalize(query).strip()
+        if not query:
+            return []
+
+        start, end = self._prefix_range(state, query)
+        ranked = [((0, 0, 0), position) for position in range(start, end)]
+        if len(ranked) < limit:
+            ranked.extend(self._ranked_candidates(state, query, start, end))
+
+        ranked = heapq.nsmallest(
+            limit, ranked,
+            key=lambda item: (item[0], state.keys[item[1]], item[1])
+        )
+        return [state.rows[position] for _, position in ranked]
+
+    def _ranked_candidates(self, state, query, start, end):
+        query_trigrams = self.trigrams(query)
+        if not query_trigrams:
+            return
+
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(state.postings.get(trigram, ()))
+
+        word_query = self.words(query)
+        for position, count in shared.items():
+            if start <= position < end:
+                continue
+            if word_query in state.words[position]:
+                yield (1, 0, 0), position
+            elif query in state.keys[position]:
+                yield (2, 0, 0), position
+            else:
+                similarity = count / len(query_trigrams)
+                if similarity >= TRIGRAM_THRESHOLD:
+                    yield (
+                        (3, -similarity, len(state.keys[position])),
+                        position
+                    )
+
+    @staticmethod
+    def _prefix_range(state, prefix):
+        start = bisect_left(state.keys, prefix)
+        end = bisect_left(state.keys, prefix + chr(0x10FFFF), lo=start)
+        return start, end
+
+
+ingredient_index = IngredientIndex()
+
+
+class RenderedCatalog:
+    """
+    Полный список каталога, заранее отрендеренный в JSON.
+
+    Байты ответа и их gzip-вариант готовятся один раз на версию
+    каталога и отдаются без сериализации.
+    """
+
+    def __init__(self, model, loader):
+        self.model = model
+        self.loader = loader
+        self._state = RenderedState(None, b'', b'')
+
+    @staticmethod
+    def is_applicable(request):
+        return not request.query_params and isinstance(
+            request.accepted_renderer, JSONRenderer
+        )
+
+    @staticmethod
+    def accepts_gzip(request):
+        return bool(
+            ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        )
+
+    def encoding(self, request):
+        """Вариант кодирования ответа на запрос, '' если не применимо."""
+        if not self.is_applicable(request):
+            return ''
+        return 'gzip' if self.accepts_gzip(request) else 'identity'
+
+    def get(self):
+        version = get_version(model_version_name(self.model))
+        if version != self._state.version:
+            data = self.loader()
+            if data is None:
+                return None
+            body = JSONRenderer().render(data)
+            self._state = RenderedState(
+                version, body, gzip.compress(body, mtime=0)
+            )
+        return self._state
+
+    def response(self, request):
+        """Готовый ответ или None, если его нельзя использовать."""
+        if not self.is_applicable(request):
+            return None
+
+        state = self.get()
+        if state is None:
+            return None
+
+        response = HttpResponse(content_type='application/json')
+        if self.accepts_gzip(request):
+            response.content = state.gzip
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response.content = state.identity
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+rendered_tags = RenderedCatalog(Tag, tag_catalog.all)
+rendered_ingredients = RenderedCatalog(
+    Ingredient, lambda: ingredient_index.startswith('')
+)
+
+
+def warm_up():
+    """Загрузка каталогов при старте воркера."""
+    try:
+        tag_catalog.refresh()
+        ingredient_index.build()
+    except DatabaseError:
+        pass
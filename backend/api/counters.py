@@ -0,0 +1,70 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart
+
+User = get_user_model()
+
+COUNTERS = {
+    Favorite: (Recipe, 'favorites_count', 'recipe'),
+    ShoppingCart: (Recipe, 'cart_count', 'recipe'),
+    Follow: (User, 'followers_count', 'author'),
+    Recipe: (User, 'recipes_count', 'author'),
+}
+
+
+def counted_object_id(instance):
+    """id объекта, в счётчике которого учитывается строка instance."""
+    _, _, relation = COUNTERS[type(instance)]
+    return getattr(instance, f'{relation}_id')
+
+
+def change_counters(model, ids, delta):
+    """
+    Меняет на delta счётчик строк model у объектов с id из ids.
+
+    Обновление атомарное, через F(); счётчик не опускается ниже нуля.
+    """
+    ids = list(ids)
+    if not ids or not delta:
+        return
+    target, field, _ = COUNTERS[model]
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, 0)
+    target.objects.filter(pk__in=ids).update(**{field: value})
+
+
+def release_counters(model, **filters):
+    """
+    Уменьшает на единицу счётчики объектов по строкам model из filters.
+
+    Один UPDATE с подзапросом. Строки отбираются по одному
+    пользователю: пары (пользователь, объект) уникальны, поэтому
+    каждый объект учитывается один раз.
+    """
+    target, field, relation = COUNTERS[model]
+    target.objects.filter(
+        pk__in=model.objects.filter(**filters).values(relation)
+    ).update(**{field: Greatest(F(field) - 1, 0)})
+
+
+def repair_counters():
+    """
+    Пересчитывает все счётчики по исходным таблицам.
+
+    Возвращает словарь с числом исправленных строк для каждого счётчика.
+    """
+    repaired = {}
+    for model, (target, field, relation) in COUNTERS.items():
+        count = Coalesce(Subquery(
+            model.objects.filter(**{relation: OuterRef('pk')})
+            .order_by().values(relation)
+            .annotate(count=Count('*')).values('count')
+        ), 0)
+        repaired[f'{target._meta.label}.{field}'] = (
+            target.objects.exclude(**{field: count})
+            .update(**{field: count})
+        )
+    return repaired
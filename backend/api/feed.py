@@ -0,0 +1,135 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from recipes.models import FeedEntry, Follow, Recipe
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+
+def merged_authors_filter(prefix=''):
+    """
+    Условие на авторов, рецепты которых подмешиваются в ленту при чтении.
+
+    Это авторы с числом подписчиков больше FEED_FANOUT_LIMIT по
+    счётчику followers_count; остальные раскладываются по лентам.
+    Раскладка и чтение решают по одному и тому же условию.
+    """
+    return Q(**{
+        f'{prefix}followers_count__gt': settings.FEED_FANOUT_LIMIT
+    })
+
+
+def get_followers_count(author_id):
+    return User.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True
+    ).first() or 0
+
+
+def is_fanout_author(author_id):
+    """Раскладываются ли рецепты автора по лентам подписчиков."""
+    return not User.objects.filter(
+        merged_authors_filter(), pk=author_id
+    ).exists()
+
+
+def get_merged_authors(user):
+    """Авторы из подписок пользователя, рецепты которых подмешиваются."""
+    return list(
+        Follow.objects.filter(
+            merged_authors_filter('author__'), user=user
+        ).values_list('author_id', flat=True)
+    )
+
+
+def add_feed_entries(user_ids, author_id, recipes):
+    """Добавляет рецепты (id, дата) автора в ленты пользователей."""
+    entries = []
+    for user_id in user_ids:
+        entries.extend(
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                created=created
+            )
+            for recipe_id, created in recipes
+        )
+        if len(entries) >= BATCH_SIZE:
+            FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+            entries = []
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def get_recent_recipes(author_id):
+    """Последние FEED_BACKFILL_SIZE рецептов автора: (id, дата)."""
+    return list(
+        Recipe.objects.filter(author_id=author_id).order_by(
+            '-created', '-id'
+        ).values_list('id', 'created')[:settings.FEED_BACKFILL_SIZE]
+    )
+
+
+def fan_out_recipe(recipe):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    if not is_fanout_author(recipe.author_id):
+        return
+
+    followers = Follow.objects.filter(author_id=recipe.author_id).values_list(
+        'user_id', flat=True
+    )
+    add_feed_entries(
+        followers.iterator(chunk_size=BATCH_SIZE),
+        recipe.author_id,
+        [(recipe.id, recipe.created)]
+    )
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту последние рецепты автора после подписки."""
+    if is_fanout_author(author_id):
+        add_feed_entries(
+            [user_id], author_id, get_recent_recipes(author_id)
+        )
+
+
+def trim_feed(user_id, author_id):
+    """
+    Убирает из ленты рецепты автора после отписки.
+
+    Если после отписки автор вернулся к раскладке по лентам, ленты
+    всех его подписчиков дополняются рецептами, опубликованными, пока
+    они подмешивались при чтении.
+    """
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+    if get_followers_count(author_id) == settings.FEED_FANOUT_LIMIT:
+        refill_feeds(author_id)
+
+
+def get_authors_at_limit(user_id):
+    """
+    Авторы из подписок пользователя с FEED_FANOUT_LIMIT подписчиков.
+
+    Вызывается при удалении пользователя после уменьшения счётчиков:
+    ленты подписчиков этих авторов нужно дополнить.
+    """
+    return list(
+        Follow.objects.filter(
+            user_id=user_id,
+            author__followers_count=settings.FEED_FANOUT_LIMIT
+        ).values_list('author_id', flat=True)
+    )
+
+
+def refill_feeds(author_id):
+    """Дополняет ленты всех подписчиков автора его последними рецептами."""
+    followers = Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True
+    )
+    add_feed_entries(
+        followers.iterator(chunk_size=BATCH_SIZE),
+        author_id,
+        get_recent_recipes(author_id)
+    )
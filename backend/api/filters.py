@@ -1,16 +1,22 @@
+from django.db.models import Case, Exists, IntegerField, OuterRef, When
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from api.catalog import tag_catalog
+from api.ranking import ORDERINGS, POPULAR
+from constant import INGREDIENT_SEARCH_LIMIT
+from recipes.models import Ingredient, Recipe
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_catalog.slugs()]
 
 
 class RecipeFilter(filters.FilterSet):
     """Фильтрации для рецептов."""
 
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-        conjoined=False
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags'
     )
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorited'
@@ -18,6 +24,27 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    ordering = filters.ChoiceFilter(
+        choices=[(value, value) for value in ORDERINGS],
+        method='filter_ordering'
+    )
+
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тегов.
+
+        Полусоединение EXISTS по уникальному индексу (recipe_id, tag_id)
+        таблицы связи не размножает строки и не требует DISTINCT.
+        """
+        if not value:
+            return queryset
+
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'),
+                tag_id__in=tag_catalog.ids_for_slugs(value)
+            )
+        ))
 
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
@@ -33,18 +60,44 @@ class RecipeFilter(filters.FilterSet):
             if user.is_anonymous:
                 return queryset.none()
             return queryset.filter(shopping_recipe__user=user)
-        return
+        return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        """
+        Сортировка по популярности.
+
+        Списки с этим параметром отдаются из закэшированного рейтинга,
+        а здесь задаётся тот же порядок для запросов к базе.
+        """
+        if ORDERINGS.get(value) == POPULAR:
+            return queryset.order_by('-favorites_count', '-created', '-id')
+        return queryset
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+            'ordering'
+        )
 
 
 class IngredientFilter(filters.FilterSet):
     """Фильтрация для ингредиентов."""
 
     name = filters.CharFilter(field_name='name', lookup_expr='istartswith')
+    search = filters.CharFilter(method='filter_search')
+
+    def filter_search(self, queryset, name, value):
+        """Поиск по подстроке: сначала по началу названия и слова."""
+        return queryset.filter(name__icontains=value).annotate(
+            rank=Case(
+                When(name__istartswith=value, then=0),
+                When(name__icontains=f' {value}', then=1),
+                default=2,
+                output_field=IntegerField()
+            )
+        ).order_by('rank', 'name')[:INGREDIENT_SEARCH_LIMIT]
 
     class Meta:
         model = Ingredient
-        fields = ('name', )
+        fields = ('name', 'search')
@@ -1,22 +1,146 @@
+import hashlib
+from calendar import timegm
+
+from django.db import connection, transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework import status
 from rest_framework.response import Response
 
+from api.cache import bump_version, get_followed_authors, user_version_name
+from api.counters import change_counters
+from api.shopping_list import update_shopping_lists
+from recipes.models import Recipe, ShoppingCart
+
+
+def get_request_follows(request):
+    """
+    Подписки текущего пользователя, загружаемые один раз за запрос.
+
+    Возвращает пустое множество для анонимного пользователя.
+    """
+    if not request or not getattr(request, 'user', None):
+        return frozenset()
+    if not request.user.is_authenticated:
+        return frozenset()
+
+    follows = getattr(request, '_followed_authors', None)
+    if follows is None:
+        follows = get_followed_authors(request.user)
+        request._followed_authors = follows
+    return follows
+
 
 class IsSubscribedMixin:
     """Проверка подписки пользователя на автора."""
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
+        return obj.id in get_request_follows(self.context.get('request'))
+
+
+def get_defaults(model, names):
+    """Значения по умолчанию полей модели, не перечисленных в names."""
+    fields = (model._meta.get_field(name) for name in names)
+    given = {field.name for field in fields}
+    return {
+        field.name: field.get_default()
+        for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in given
+        and field.has_default()
+    }
+
+
+def insert_ignore_conflicts(model, **values):
+    """
+    Одна вставка INSERT ... ON CONFLICT DO NOTHING.
+
+    Возвращает True, если строка добавлена, и False, если такая
+    уже есть. Сигналы моделей не отправляются.
+    """
+    values = {**get_defaults(model, values), **values}
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(model._meta.get_field(name).column) for name in values
+    )
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+            f'VALUES ({placeholders}) ON CONFLICT DO NOTHING',
+            list(values.values())
+        )
+        return cursor.rowcount > 0
 
-        if request and hasattr(
-            request, 'user'
-        ) and request.user.is_authenticated:
 
-            return obj.follower.filter(
-                user=request.user
-            ).exists()
+def delete_rows(model, **filters):
+    """
+    Одно удаление DELETE ... WHERE без предварительной выборки.
 
-        return False
+    Возвращает число удалённых строк. Сигналы моделей не отправляются.
+    """
+    quote = connection.ops.quote_name
+    conditions = ' AND '.join(
+        f'{quote(model._meta.get_field(name).column)} = %s'
+        for name in filters
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} WHERE {conditions}',
+            list(filters.values())
+        )
+        return cursor.rowcount
+
+
+def insert_many_ignore_conflicts(model, field, values, **common):
+    """
+    Вставка нескольких строк одним INSERT ... ON CONFLICT DO NOTHING.
+
+    Строки отличаются значением field, остальные поля общие.
+    Возвращает множество значений field у добавленных строк.
+    Сигналы моделей не отправляются.
+    """
+    common = {**get_defaults(model, [*common, field]), **common}
+    quote = connection.ops.quote_name
+    names = [*common, field]
+    columns = ', '.join(
+        quote(model._meta.get_field(name).column) for name in names
+    )
+    row = '({})'.format(', '.join(['%s'] * len(names)))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+            f'VALUES {", ".join([row] * len(values))} '
+            f'ON CONFLICT DO NOTHING '
+            f'RETURNING {quote(model._meta.get_field(field).column)}',
+            [
+                param for value in values
+                for param in (*common.values(), value)
+            ]
+        )
+        return {inserted for inserted, in cursor.fetchall()}
+
+
+def delete_many(model, field, values, **filters):
+    """
+    Удаление строк со значением field из values одним DELETE.
+
+    Возвращает множество значений field у удалённых строк.
+    Сигналы моделей не отправляются.
+    """
+    quote = connection.ops.quote_name
+    column = quote(model._meta.get_field(field).column)
+    conditions = ''.join(
+        f'{quote(model._meta.get_field(name).column)} = %s AND '
+        for name in filters
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} WHERE {conditions}'
+            f'{column} IN ({", ".join(["%s"] * len(values))}) '
+            f'RETURNING {column}',
+            [*filters.values(), *values]
+        )
+        return {deleted for deleted, in cursor.fetchall()}
 
 
 class RecipeActionMixin:
@@ -27,25 +151,144 @@ class RecipeActionMixin:
         user = request.user
 
         if request.method == 'POST':
-            obj, created = model.objects.get_or_create(
-                user=user, recipe=recipe)
+            with transaction.atomic():
+                if not insert_ignore_conflicts(
+                        model, user_id=user.id, recipe_id=recipe.id):
+                    return Response(
+                        {'detail': 'Такой рецепт уже присутствует'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                change_counters(model, [recipe.id], 1)
+                if model is ShoppingCart:
+                    update_shopping_lists([recipe.id], 1, user.id)
 
-            if not created:
+            bump_version(user_version_name(user.id))
+            data = serializer_class(recipe, context={'request': request}).data
+            return Response(data, status=status.HTTP_201_CREATED)
+
+        with transaction.atomic():
+            if not delete_rows(model, user_id=user.id, recipe_id=recipe.id):
                 return Response(
-                    {'detail': 'Такой рецепт уже присутствует'},
+                    {'detail': 'Рецепт не найден.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            change_counters(model, [recipe.id], -1)
+            if model is ShoppingCart:
+                update_shopping_lists([recipe.id], -1, user.id)
 
-            data = serializer_class(recipe, context={'request': request}).data
-            return Response(data, status=status.HTTP_201_CREATED)
+        bump_version(user_version_name(user.id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-        obj = model.objects.filter(user=user, recipe=recipe).first()
+    def bulk_recipe_action(self, request, model, serializer_class):
+        """
+        Добавление или удаление списка рецептов одним запросом.
 
-        if not obj:
-            return Response(
-                {'detail': 'Рецепт не найден.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        Для каждого id возвращается статус, как у одиночного действия:
+        201 или 204 при успехе, 400 если рецепт уже добавлен или
+        отсутствует в списке, 404 если рецепта нет.
+        """
+        serializer = serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        user = request.user
 
-        obj.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        found = set(
+            Recipe.objects.filter(id__in=recipe_ids)
+            .values_list('id', flat=True)
+        )
+        with transaction.atomic():
+            if request.method == 'POST':
+                changed = insert_many_ignore_conflicts(
+                    model, 'recipe', found, user=user.id
+                ) if found else set()
+                sign, success = 1, status.HTTP_201_CREATED
+            else:
+                changed = delete_many(
+                    model, 'recipe', found, user=user.id
+                ) if found else set()
+                sign, success = -1, status.HTTP_204_NO_CONTENT
+            change_counters(model, changed, sign)
+            if model is ShoppingCart:
+                update_shopping_lists(changed, sign, user.id)
+
+        if changed:
+            bump_version(user_version_name(user.id))
+
+        results = []
+        for recipe_id in recipe_ids:
+            if recipe_id in changed:
+                code = success
+            elif recipe_id in found:
+                code = status.HTTP_400_BAD_REQUEST
+            else:
+                code = status.HTTP_404_NOT_FOUND
+            results.append({'id': recipe_id, 'status': code})
+        return Response({'results': results})
+
+
+class ConditionalGetMixin:
+    """
+    Ответ 304 на условные GET-запросы.
+
+    Состояние ресурса берётся из get_conditional_state без
+    сериализации данных.
+    """
+
+    user_dependent_etag = False
+
+    def get_conditional_state(self, request):
+        """Возвращает (время изменения, список версий) или None."""
+        return None
+
+    def get_encoding_variant(self, request):
+        """Кодирование заранее сжатого ответа, '' если его нет."""
+        return ''
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.list_response, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.retrieve_response, request, *args, **kwargs
+        )
+
+    def list_response(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def retrieve_response(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        state = self.get_conditional_state(request)
+        if state is None:
+            return handler(request, *args, **kwargs)
+
+        last_modified, versions = state
+        user_id = request.user.pk if self.user_dependent_etag else None
+        encoding = self.get_encoding_variant(request)
+        etag = quote_etag(hashlib.md5(repr((
+            request.get_full_path(), request.accepted_renderer.format,
+            encoding, user_id, last_modified, versions
+        )).encode()).hexdigest())
+        timestamps = [version // 10 ** 9 for version in versions]
+        if last_modified is not None:
+            timestamps.append(timegm(last_modified.utctimetuple()))
+        timestamp = max(timestamps, default=0)
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(timestamp)
+        if self.user_dependent_etag:
+            patch_vary_headers(response, ('Authorization',))
+        if encoding:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -1,8 +1,277 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api.cache import get_version, model_version_name, user_version_name
+from constant import MAX_PAGE_SIZE, PAGE_SIZE
+from recipes.models import Recipe
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Пагинатор с кэшируемым количеством объектов.
+
+    Для больших списков без фильтров вместо COUNT(*) берётся
+    оценка планировщика PostgreSQL.
+    """
+
+    def __init__(self, object_list, per_page, cache_key=None,
+                 estimate=False, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.estimate = estimate
+
+    @cached_property
+    def count(self):
+        if self.cache_key is None:
+            return Paginator.count.func(self)
+
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = self.estimate_count() if self.estimate else None
+            if count is None:
+                count = Paginator.count.func(self)
+            cache.set(self.cache_key, count, settings.COUNT_CACHE_TTL)
+        return count
+
+    def estimate_count(self):
+        """Оценка числа строк таблицы или None, если она мала."""
+        model = self.object_list.model
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [model._meta.db_table]
+            )
+            row = cursor.fetchone()
+
+        if not row or row[0] < settings.COUNT_ESTIMATE_THRESHOLD:
+            return None
+        return row[0]
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по ключу сортировки.
+
+    Следующая страница выбирается условием по значениям ключа
+    последнего элемента, поэтому нет ни COUNT(*), ни OFFSET.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
+    ordering = ('-created', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        last = self.page[-1]
+        position = [
+            str(getattr(last, field.lstrip('-'))) for field in self.ordering
+        ]
+        encoded = b64encode(json.dumps(position).encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            encoded
+        )
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            values = json.loads(b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                (field, model._meta.get_field(field.lstrip('-')).to_python(
+                    value
+                ))
+                for field, value in zip(self.ordering, values)
+            ]
+        except (BinasciiError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def get_seek_filter(position):
+        """
+        Условие «строго после позиции» для составного ключа.
+
+        Для ключа (a, b) это a < x OR (a = x AND b < y), дополненное
+        a <= x, чтобы индекс по первому полю ограничивал диапазон.
+        """
+        seek = Q()
+        equal = Q()
+        for field, value in position:
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            seek |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        first_field, first_value = position[0]
+        bound = 'lte' if first_field.startswith('-') else 'gte'
+        return Q(**{f'{first_field.lstrip("-")}__{bound}': first_value}) & seek
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Курсорная пагинация ленты, собранной из нескольких источников.
+
+    Каждый источник — queryset с полями (дата, id рецепта); из каждого
+    берётся не больше страницы после курсора, результаты сливаются.
+    """
+
+    def paginate_sources(self, sources, fetch, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, Recipe)
+
+        keys = set()
+        for queryset, ordering in sources:
+            queryset = queryset.order_by(*ordering)
+            if position is not None:
+                queryset = queryset.filter(self.get_seek_filter([
+                    (field, value)
+                    for field, (_, value) in zip(ordering, position)
+                ]))
+            keys.update(queryset.values_list(
+                *(field.lstrip('-') for field in ordering)
+            )[:self.page_size + 1])
+
+        keys = sorted(keys, reverse=True)
+        self.has_next = len(keys) > self.page_size
+        keys = keys[:self.page_size]
+
+        objects = fetch([pk for _, pk in keys])
+        self.page = [objects[pk] for _, pk in keys if pk in objects]
+        return self.page
 
 
 class CustomPagination(PageNumberPagination):
-    """Пагинатор для вывода 6 элементов на странице."""
+    """
+    Пагинатор для вывода 6 элементов на странице.
+
+    При наличии параметра cursor в запросе переключается на
+    курсорную пагинацию. Готовые списки, например рейтинги,
+    разбиваются на страницы без запросов к базе.
+    """
 
     page_size_query_param = 'limit'
-    page_size = 6
+    page_size = PAGE_SIZE
+    cursor_pagination_class = KeysetPagination
+    user_scoped_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor_param = self.cursor_pagination_class.cursor_query_param
+
+        if isinstance(queryset, list):
+            self.django_paginator_class = Paginator
+            return super().paginate_queryset(queryset, request, view)
+
+        if cursor_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+
+        filters = self.get_filter_params(request)
+        user_scoped = self.is_user_scoped(request, view, filters)
+        self.django_paginator_class = partial(
+            CachedCountPaginator,
+            cache_key=self.get_count_cache_key(
+                queryset, request, filters, user_scoped
+            ),
+            estimate=not filters and not user_scoped
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_filter_params(self, request):
+        """Нормализованный набор фильтров запроса."""
+        ignored = (self.page_query_param, self.page_size_query_param)
+        return sorted(
+            (key, sorted(request.query_params.getlist(key)))
+            for key in request.query_params
+            if key not in ignored
+        )
+
+    def is_user_scoped(self, request, view, filters):
+        """Зависит ли список от текущего пользователя."""
+        if not request.user.is_authenticated:
+            return False
+        if view is not None and view.action in getattr(
+            view, 'user_scoped_count_actions', ()
+        ):
+            return True
+        return any(key in self.user_scoped_params for key, _ in filters)
+
+    def get_count_cache_key(self, queryset, request, filters, user_scoped):
+        versions = [get_version(model_version_name(queryset.model))]
+        if user_scoped:
+            versions.append(request.user.pk)
+            versions.append(get_version(user_version_name(request.user.pk)))
+
+        digest = hashlib.md5(
+            json.dumps([request.path, filters, versions]).encode()
+        ).hexdigest()
+        return f'count:{digest}'
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
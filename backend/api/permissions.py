@@ -16,3 +16,10 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
             request.method in permissions.SAFE_METHODS
             or obj.author == request.user
         )
+
+
+class IsAuthor(permissions.BasePermission):
+    """Доступ только автору рецепта."""
+
+    def has_object_permission(self, request, view, obj):
+        return obj.author == request.user
@@ -0,0 +1,87 @@
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef
+from django.utils import timezone
+
+from api.cache import get_version, model_version_name
+from recipes.models import Favorite, Recipe
+
+RANKING_KEY = 'ranking:{}:{}:{}'
+POPULAR = 'popular'
+TRENDING = 'trending'
+ORDERINGS = {
+    'popular': POPULAR,
+    '-favorites': POPULAR,
+    'trending': TRENDING,
+}
+
+Ranking = namedtuple('Ranking', ('stamp', 'ids'))
+
+
+def with_tags(queryset, tag_ids, recipe_field):
+    """Строки рецептов хотя бы с одним из тегов."""
+    if not tag_ids:
+        return queryset
+    return queryset.filter(Exists(
+        Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef(recipe_field), tag_id__in=tag_ids
+        )
+    ))
+
+
+def compute_ranking(kind, tag_ids):
+    """
+    id не более чем RANKING_SIZE лучших рецептов.
+
+    popular — по счётчику избранного, trending — по числу добавлений
+    в избранное за последние TRENDING_DAYS дней.
+    """
+    if kind == POPULAR:
+        queryset = with_tags(
+            Recipe.objects.order_by('-favorites_count', '-created', '-id'),
+            tag_ids, 'pk'
+        ).values_list('id', flat=True)
+    else:
+        since = timezone.now() - timedelta(days=settings.TRENDING_DAYS)
+        queryset = with_tags(
+            Favorite.objects.filter(created__gte=since), tag_ids, 'recipe_id'
+        ).values('recipe').annotate(count=Count('*')).order_by(
+            '-count', '-recipe'
+        ).values_list('recipe', flat=True)
+    return list(queryset[:settings.RANKING_SIZE])
+
+
+def ranking_cache_key(kind, tag_ids):
+    return RANKING_KEY.format(
+        kind,
+        ','.join(str(pk) for pk in tag_ids) or 'all',
+        get_version(model_version_name(Recipe))
+    )
+
+
+def refresh_ranking(kind, tag_ids=()):
+    """Пересчитывает рейтинг и кладёт его в кэш."""
+    tag_ids = sorted(set(tag_ids))
+    ranking = Ranking(time.time_ns(), compute_ranking(kind, tag_ids))
+    cache.set(
+        ranking_cache_key(kind, tag_ids), ranking, settings.RANKING_CACHE_TTL
+    )
+    return ranking
+
+
+def get_ranking(kind, tag_ids=()):
+    """
+    Закэшированный рейтинг для набора тегов.
+
+    Пересчитывается по истечении RANKING_CACHE_TTL или при новой
+    версии списка рецептов.
+    """
+    tag_ids = sorted(set(tag_ids))
+    ranking = cache.get(ranking_cache_key(kind, tag_ids))
+    if ranking is None:
+        ranking = refresh_ranking(kind, tag_ids)
+    return ranking
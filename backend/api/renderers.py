@@ -0,0 +1,95 @@
+import csv
+import json
+from abc import ABCMeta, abstractmethod
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class Echo:
+    """Псевдо-файл, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer, metaclass=ABCMeta):
+    """
+    Базовый формат выгрузки списка покупок.
+
+    stream отдаёт документ по частям из итератора строк
+    с полями ingredient__name, ingredient__measurement_unit
+    и total_amount, не собирая его целиком в памяти.
+    Ответы с ошибками, словари, отдаются в JSON.
+    """
+
+    charset = 'utf-8'
+
+    @abstractmethod
+    def stream(self, ingredients):
+        """Части документа для итератора строк списка покупок."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            response = (renderer_context or {}).get('response')
+            if response is not None:
+                response['Content-Type'] = JSONRenderer.media_type
+            return JSONRenderer().render(data)
+        return ''.join(self.stream(data)).encode(self.charset)
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в CSV."""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield '\ufeff'
+        yield writer.writerow(['Ингредиенты', 'Количество'])
+        for ingredient in ingredients:
+            yield writer.writerow([
+                f"{ingredient['ingredient__name']} "
+                f"({ingredient['ingredient__measurement_unit']})",
+                ingredient['total_amount']
+            ])
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок простым текстом."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        for ingredient in ingredients:
+            yield (
+                f"{ingredient['ingredient__name']} - "
+                f"{ingredient['total_amount']} "
+                f"({ingredient['ingredient__measurement_unit']})\n"
+            )
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в JSON."""
+
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, ingredients):
+        separator = '['
+        for ingredient in ingredients:
+            yield separator + json.dumps({
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['total_amount'],
+            }, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_RENDERERS = (
+    CSVShoppingListRenderer,
+    TextShoppingListRenderer,
+    JSONShoppingListRenderer,
+)
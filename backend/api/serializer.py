@@ -1,30 +1,185 @@
 import base64
-from django.core.files.base import ContentFile
+import binascii
+import tempfile
+import warnings
+from collections import defaultdict
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
+from PIL import Image, UnidentifiedImageError
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
 from rest_framework.validators import UniqueValidator
 
-from api.mixins import IsSubscribedMixin
+from api.cache import get_rendered_recipes, set_rendered_recipes
+from api.catalog import tag_catalog
+from api.mixins import IsSubscribedMixin, delete_many, get_request_follows
+from api.shopping_list import update_shopping_lists
+from api.thumbnails import variant_urls
 from recipes.models import (Ingredient,
                             IngredientInRecipe,
                             Recipe,
+                            ShoppingCart,
                             Tag
                             )
 from users.models import User
-from constant import MAXLEN, MESSAGE, MES_MAX
+from constant import (BASE64_CHUNK_SIZE, BASE64_HEADER_LENGTH, MAXLEN,
+                      MESSAGE, MES_MAX)
 
 
 class Base64ImageField(serializers.ImageField):
-    """Кастомное поле для кодирования изображения в base64."""
+    """
+    Кастомное поле для кодирования изображения в base64.
+
+    Строка data:image/...;base64,... декодируется частями во временный
+    файл. Размер проверяется до декодирования, а формат и размеры
+    картинки — по заголовку, без распаковки пикселей.
+    """
+
+    default_error_messages = {
+        "invalid_base64": "Некорректные данные base64.",
+        "too_large": "Размер изображения превышает {max_size} байт.",
+        "too_many_pixels": "Изображение больше {max_pixels} пикселей.",
+    }
 
     def to_internal_value(self, data):
         """Преобразование картинки."""
         if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
-            ext = format.split("/")[-1]
-            data = ContentFile(base64.b64decode(imgstr), name="photo." + ext)
+            return serializers.FileField.to_internal_value(
+                self, self.decode(data)
+            )
 
         return super().to_internal_value(data)
 
+    def decode(self, data):
+        header, separator, _ = data[:BASE64_HEADER_LENGTH].partition(
+            ";base64,"
+        )
+        if not separator:
+            self.fail("invalid_base64")
+        start = len(header) + len(separator)
+
+        size = (len(data) - start) * 3 // 4 - data.count("=", -2)
+        if size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail("too_large", max_size=settings.IMAGE_UPLOAD_MAX_SIZE)
+
+        file = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        try:
+            for position in range(start, len(data), BASE64_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    data[position:position + BASE64_CHUNK_SIZE],
+                    validate=True
+                ))
+            image_format = self.check_image(file)
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail("invalid_base64")
+        except serializers.ValidationError:
+            file.close()
+            raise
+
+        file.seek(0)
+        return UploadedFile(
+            file,
+            name=f"photo.{image_format.lower()}",
+            content_type=Image.MIME[image_format],
+            size=size
+        )
+
+    def check_image(self, file):
+        """Формат изображения по заголовку файла."""
+        file.seek(0)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("error", Image.DecompressionBombWarning)
+                image = Image.open(file)
+            if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+                self.fail(
+                    "too_many_pixels", max_pixels=settings.IMAGE_MAX_PIXELS
+                )
+            image.verify()
+        except (Image.DecompressionBombWarning,
+                Image.DecompressionBombError):
+            self.fail("too_many_pixels", max_pixels=settings.IMAGE_MAX_PIXELS)
+        except (OSError, SyntaxError, UnidentifiedImageError):
+            self.fail("invalid_image")
+        if image.format not in Image.MIME:
+            self.fail("invalid_image")
+        return image.format
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    """Список связанных объектов, загружаемых одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, "__iter__"):
+            self.fail("not_a_list", input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail("empty")
+        return self.child_relation.resolve(data)
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Поле первичного ключа с пакетной загрузкой объектов.
+
+    Все id загружаются одним запросом IN (...) или функцией loader,
+    а все отсутствующие id попадают в одну ошибку. Загруженные объекты
+    запоминаются, поэтому после resolve поле отвечает без запросов.
+    """
+
+    default_error_messages = {
+        "does_not_exist_many": "Объекты не найдены: {pk_values}.",
+    }
+
+    def __init__(self, loader=None, **kwargs):
+        self.loader = loader
+        self.resolved = {}
+        super().__init__(**kwargs)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {"child_relation": cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+    def resolve(self, data):
+        """Объекты по списку id в том же порядке."""
+        pks = [self.to_pk(item) for item in data]
+        wanted = {pk for pk in pks if pk not in self.resolved}
+        if wanted:
+            self.resolved.update(
+                self.loader(wanted) if self.loader
+                else self.get_queryset().in_bulk(wanted)
+            )
+
+        missing = [pk for pk in dict.fromkeys(pks) if pk not in self.resolved]
+        if missing:
+            self.fail(
+                "does_not_exist_many",
+                pk_values=", ".join(str(pk) for pk in missing)
+            )
+        return [self.resolved[pk] for pk in pks]
+
+    def to_internal_value(self, data):
+        return self.resolve([data])[0]
+
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     """Регистрация новых пользователей."""
@@ -72,10 +227,23 @@ class PasswordSetSerializer(serializers.Serializer):
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Краткое представления рецептов."""
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_variants", "cooking_time")
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get("request"))
+
+
+class UserSubscriptionListSerializer(serializers.ListSerializer):
+    """Список подписок с загрузкой рецептов всех авторов одним запросом."""
+
+    def to_representation(self, data):
+        authors = list(data.all() if hasattr(data, "all") else data)
+        self.child.load_recipes(authors)
+        return super().to_representation(authors)
 
 
 class UserSubscriptionSerializer(
@@ -95,26 +263,46 @@ class UserSubscriptionSerializer(
             "email", "id", "username", "first_name", "last_name",
             "is_subscribed", "recipes", "recipes_count", "avatar"
         )
+        list_serializer_class = UserSubscriptionListSerializer
 
-    def get_recipes(self, obj):
+    def load_recipes(self, authors):
+        """
+        Последние рецепты авторов одним запросом.
 
+        При заданном recipes_limit рецепты нумеруются оконной функцией
+        ROW_NUMBER() в пределах автора и отбираются первые N.
+        """
         recipes_limit = self.context.get("recipes_limit")
+        queryset = Recipe.objects.filter(
+            author__in=[author.id for author in authors]
+        ).order_by("-created", "-id")
 
-        if recipes_limit is not None:
-            try:
-                recipes_limit = int(recipes_limit)
-            except ValueError:
-                raise serializers.ValidationError(
-                    "recipes_limit должен быть числом.")
-
-        recipes = obj.recipes
         if recipes_limit:
-            recipes = recipes[:recipes_limit]
+            sql, params = queryset.annotate(row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F("author_id")],
+                order_by=[F("created").desc(), F("id").desc()]
+            )).query.sql_with_params()
+            queryset = Recipe.objects.raw(
+                f"SELECT * FROM ({sql}) ranked WHERE row_number <= %s "
+                "ORDER BY author_id, row_number",
+                (*params, recipes_limit)
+            )
 
-        return RecipeShortSerializer(recipes, many=True).data
+        self.recipes_by_author = defaultdict(list)
+        for recipe in queryset:
+            self.recipes_by_author[recipe.author_id].append(recipe)
+
+    def get_recipes(self, obj):
+        if getattr(self, "recipes_by_author", None) is None:
+            self.load_recipes([obj])
+
+        return RecipeShortSerializer(
+            self.recipes_by_author[obj.id], many=True
+        ).data
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -143,10 +331,22 @@ class AvatarSerializer(serializers.ModelSerializer):
         return data
 
 
+class IngredientInRecipeListSerializer(serializers.ListSerializer):
+    """Список ингредиентов рецепта с загрузкой всех id одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child.fields["id"].resolve([
+                item["id"] for item in data
+                if isinstance(item, dict) and "id" in item
+            ])
+        return super().to_internal_value(data)
+
+
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     """Работа с ингредиентами, использующимися в рецептах."""
 
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(), source="ingredient.id"
     )
     name = serializers.CharField(source="ingredient.name", read_only=True)
@@ -158,20 +358,37 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientInRecipe
         fields = ("id", "name", "measurement_unit", "amount")
+        list_serializer_class = IngredientInRecipeListSerializer
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов, собираемый из кэша одним запросом."""
+
+    def to_representation(self, data):
+        recipes = data.all() if hasattr(data, "all") else data
+        return self.child.render(list(recipes))
 
 
 class RecipeSerializer(serializers.ModelSerializer):
-    """Основной сериализатор для рецептов."""
+    """
+    Основной сериализатор для рецептов.
+
+    Не зависящая от пользователя часть представления кэшируется,
+    персональные флаги добавляются при каждом запросе.
+    """
 
     cooking_time = serializers.IntegerField(
         max_value=MES_MAX, min_value=MESSAGE
     )
     image = Base64ImageField(max_length=None, use_url=True)
+    image_variants = serializers.SerializerMethodField()
     ingredients = IngredientInRecipeSerializer(
         source="ingredient_list", many=True
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True)
+    tags = BulkPrimaryKeyRelatedField(
+        queryset=Tag.objects.all(), many=True, write_only=True,
+        loader=tag_catalog.in_bulk
+    )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -182,6 +399,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             "tags",
             "cooking_time",
             "image",
+            "image_variants",
             "ingredients",
             "is_favorited",
             "is_in_shopping_cart",
@@ -189,14 +407,86 @@ class RecipeSerializer(serializers.ModelSerializer):
             "name"
         )
         read_only_fields = ("author",)
+        list_serializer_class = RecipeListSerializer
 
     def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        representation["tags"] = TagSerializer(
-            instance.tags.all(), many=True).data
-        representation["author"] = UserSerializer(
-            instance.author, context=self.context
-        ).data
+        return self.render([instance])[0]
+
+    def render(self, recipes):
+        """Представления рецептов: общая часть из кэша и флаги."""
+        shared = get_rendered_recipes(recipes)
+        missing = [recipe for recipe in recipes if recipe.id not in shared]
+
+        if missing:
+            tag_ids = defaultdict(list)
+            for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+                recipe__in=missing
+            ).values_list("recipe_id", "tag_id"):
+                tag_ids[recipe_id].append(tag_id)
+
+            prefetch_related_objects(
+                missing,
+                Prefetch(
+                    "ingredient_list",
+                    queryset=IngredientInRecipe.objects.select_related(
+                        "ingredient"
+                    )
+                )
+            )
+            rendered = {
+                recipe.id: self.get_shared_representation(
+                    recipe, tag_ids[recipe.id]
+                )
+                for recipe in missing
+            }
+            set_rendered_recipes(missing, rendered)
+            shared.update(rendered)
+
+        followed = get_request_follows(self.context.get("request"))
+        return [
+            self.add_personal_fields(shared[recipe.id], recipe, followed)
+            for recipe in recipes
+        ]
+
+    def get_shared_representation(self, instance, tag_ids):
+        """Часть представления, одинаковая для всех пользователей."""
+        fields = super().to_representation(instance)
+        representation = {
+            "id": fields.pop("id"),
+            "tags": tag_catalog.get_many(tag_ids),
+            **fields
+        }
+        representation["image"] = (
+            instance.image.url if instance.image else None
+        )
+        representation["author"] = UserSerializer(instance.author).data
+
+        return representation
+
+    def add_personal_fields(self, shared, instance, followed):
+        request = self.context.get("request")
+        representation = dict(shared)
+        representation["author"] = dict(shared["author"])
+        representation["is_favorited"] = self.get_is_favorited(instance)
+        representation["is_in_shopping_cart"] = (
+            self.get_is_in_shopping_cart(instance)
+        )
+        representation["author"]["is_subscribed"] = (
+            instance.author_id in followed
+        )
+
+        if request:
+            for data, field in ((representation, "image"),
+                                (representation["author"], "avatar")):
+                if data[field]:
+                    data[field] = request.build_absolute_uri(data[field])
+            representation["image_variants"] = {
+                image_format: {
+                    width: request.build_absolute_uri(url)
+                    for width, url in urls.items()
+                }
+                for image_format, urls in shared["image_variants"].items()
+            }
 
         return representation
 
@@ -239,30 +529,76 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return tags
 
-    def _process_ingredients(self, recipe, ingredients_data):
-
-        recipe.ingredients.clear()
+    def _process_ingredients(self, recipe, ingredients_data, new=False):
+        """
+        Приводит ингредиенты рецепта к переданному списку.
+
+        Меняются только отличающиеся строки: новые добавляются одним
+        INSERT, изменённые количества — одним bulk_update, лишние
+        удаляются одним DELETE. Сигналы строк не отправляются: дату
+        изменения рецепта уже обновило его сохранение.
+
+        Списки покупок пересчитываются, только если состав рецепта
+        изменился и рецепт лежит хотя бы в одной корзине; нового рецепта
+        ещё нет ни в одной корзине.
+        """
+        amounts = {
+            ingredient_data["ingredient"]["id"].id: ingredient_data["amount"]
+            for ingredient_data in ingredients_data
+        }
+        existing = {} if new else {
+            row.ingredient_id: row
+            for row in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
 
-        ingredient_instances = [
+        removed = existing.keys() - amounts.keys()
+        added = [
             IngredientInRecipe(
-                recipe=recipe,
-                ingredient=ingredient_data["ingredient"]["id"],
-                amount=ingredient_data["amount"]
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
             )
-            for ingredient_data in ingredients_data
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
         ]
-        IngredientInRecipe.objects.bulk_create(ingredient_instances)
-
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = amounts.get(ingredient_id, row.amount)
+            if amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+
+        if new:
+            IngredientInRecipe.objects.bulk_create(added)
+            return
+        if not (removed or added or changed):
+            return
+
+        in_carts = ShoppingCart.objects.filter(recipe=recipe).exists()
+        if in_carts:
+            update_shopping_lists([recipe.id], -1)
+        if removed:
+            delete_many(
+                IngredientInRecipe, "ingredient", list(removed),
+                recipe=recipe.id
+            )
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ["amount"])
+        if added:
+            IngredientInRecipe.objects.bulk_create(added)
+        if in_carts:
+            update_shopping_lists([recipe.id], 1)
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop("tags")
         ingredients_data = validated_data.pop("ingredient_list")
 
         recipe = Recipe.objects.create(**validated_data)
-        self._process_ingredients(recipe, ingredients_data)
+        self._process_ingredients(recipe, ingredients_data, new=True)
         recipe.tags.set(tags)
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags_data = validated_data.pop("tags", None)
         ingredients_data = validated_data.pop("ingredient_list", None)
@@ -277,13 +613,22 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return instance
 
+    def get_image_variants(self, obj):
+        return variant_urls(obj)
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
+
         user = self.context["request"].user
         if user.is_authenticated:
             return user.favorites.filter(recipe=obj).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
+
         user = self.context["request"].user
         if user.is_authenticated:
             return user.shopping_user.filter(recipe=obj).exists()
@@ -298,6 +643,19 @@ class FavoriteShoppingCartSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "image", "cooking_time")
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массового добавления или удаления."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_ACTION_LIMIT
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализатор для ингредиентов."""
 
@@ -0,0 +1,85 @@
+from django.db import connection
+
+from recipes.models import IngredientInRecipe, ShoppingCart, ShoppingListItem
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return {
+        'item': quote(ShoppingListItem._meta.db_table),
+        'cart': quote(ShoppingCart._meta.db_table),
+        'ingredient': quote(IngredientInRecipe._meta.db_table),
+    }
+
+
+def update_shopping_lists(recipe_ids, sign, user_id=None):
+    """
+    Прибавляет (sign=1) или вычитает (sign=-1) ингредиенты рецептов.
+
+    С user_id меняется список покупок одного пользователя, без него —
+    списки всех, у кого рецепты в корзине. Строки с нулевым количеством
+    удаляются. Вызывать в одной транзакции с изменением корзины.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+
+    tables = _tables()
+    recipes = ', '.join(['%s'] * len(recipe_ids))
+    if user_id is None:
+        source = (
+            'SELECT cart.user_id, ingredient.ingredient_id, '
+            'SUM(ingredient.amount) * %s '
+            'FROM {cart} cart JOIN {ingredient} ingredient '
+            'ON ingredient.recipe_id = cart.recipe_id '
+            f'WHERE cart.recipe_id IN ({recipes}) '
+            'GROUP BY cart.user_id, ingredient.ingredient_id'
+        )
+        params = [sign, *recipe_ids]
+        users = f'SELECT user_id FROM {{cart}} WHERE recipe_id IN ({recipes})'
+        users_params = recipe_ids
+    else:
+        source = (
+            'SELECT %s, ingredient_id, SUM(amount) * %s '
+            f'FROM {{ingredient}} WHERE recipe_id IN ({recipes}) '
+            'GROUP BY ingredient_id'
+        )
+        params = [user_id, sign, *recipe_ids]
+        users = '%s'
+        users_params = [user_id]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            ' '.join((
+                'INSERT INTO {item} (user_id, ingredient_id, total_amount)',
+                source,
+                'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                'SET total_amount = {item}.total_amount '
+                '+ EXCLUDED.total_amount'
+            )).format(**tables),
+            params
+        )
+        cursor.execute(
+            (
+                'DELETE FROM {item} WHERE total_amount <= 0 '
+                f'AND user_id IN ({users})'
+            ).format(**tables),
+            users_params
+        )
+
+
+def rebuild_shopping_lists():
+    """Пересобирает списки покупок всех пользователей по корзинам."""
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {item}'.format(**_tables()))
+        cursor.execute(
+            (
+                'INSERT INTO {item} (user_id, ingredient_id, total_amount) '
+                'SELECT cart.user_id, ingredient.ingredient_id, '
+                'SUM(ingredient.amount) '
+                'FROM {cart} cart JOIN {ingredient} ingredient '
+                'ON ingredient.recipe_id = cart.recipe_id '
+                'GROUP BY cart.user_id, ingredient.ingredient_id'
+            ).format(**_tables())
+        )
+        return cursor.rowcount
@@ -0,0 +1,62 @@
+import string
+from functools import lru_cache
+
+from django.conf import settings
+from hashids import Hashids
+
+from recipes.models import Recipe
+
+LEGACY_CODE_LENGTH = 6
+LEGACY_CODE_ALPHABET = frozenset(string.ascii_letters + string.digits)
+LEGACY_CODE_CACHE_SIZE = 4096
+
+hashids = Hashids(
+    salt=settings.SHORT_LINK_SALT, min_length=settings.SHORT_LINK_MIN_LENGTH
+)
+
+
+def encode_recipe_id(recipe_id):
+    """Короткий код рецепта, вычисляемый из id без запросов к базе."""
+    return hashids.encode(recipe_id)
+
+
+def decode_short_code(short_code):
+    """id рецепта по коду hashids или None."""
+    decoded = hashids.decode(short_code)
+    return decoded[0] if len(decoded) == 1 else None
+
+
+def is_legacy_code(short_code):
+    """Похож ли код на старый: шесть символов get_random_string."""
+    return (
+        len(short_code) == LEGACY_CODE_LENGTH
+        and LEGACY_CODE_ALPHABET.issuperset(short_code)
+    )
+
+
+@lru_cache(maxsize=LEGACY_CODE_CACHE_SIZE)
+def get_legacy_recipe_id(short_code):
+    """
+    id рецепта по старому случайному коду или None.
+
+    Старые коды больше не выдаются, поэтому результат, в том числе
+    отрицательный, хранится в ограниченном кэше процесса.
+    """
+    return Recipe.objects.filter(short_code=short_code).values_list(
+        'id', flat=True
+    ).first()
+
+
+def resolve_short_code(short_code):
+    """
+    id рецепта по короткому коду.
+
+    Коды hashids не короче SHORT_LINK_MIN_LENGTH и декодируются без
+    базы; старые шестисимвольные коды ищутся в базе через кэш.
+    Остальные короткие строки отклоняются без запросов.
+    """
+    if len(short_code) > LEGACY_CODE_LENGTH:
+        return decode_short_code(short_code)
+    if is_legacy_code(short_code):
+        return get_legacy_recipe_id(short_code)
+    return None
@@ -0,0 +1,227 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.db import transaction
+from django.dispatch import receiver
+
+from api.cache import (bump_version, model_version_name, touch_recipes,
+                       user_version_name)
+from api.counters import change_counters, counted_object_id, release_counters
+from api.feed import (backfill_feed, fan_out_recipe, get_authors_at_limit,
+                      refill_feeds, trim_feed)
+from api.shopping_list import update_shopping_lists
+from api.thumbnails import schedule_variants
+from recipes.models import (Favorite, Follow, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingCart, Tag, is_deleted_with_parent)
+
+User = get_user_model()
+
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name', 'avatar')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def model_created(sender, instance, created, **kwargs):
+    """Сброс кэша количества при добавлении рецепта или пользователя."""
+    if created:
+        bump_version(model_version_name(sender))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def model_deleted(sender, instance, **kwargs):
+    """Сброс кэша количества при удалении рецепта или пользователя."""
+    bump_version(model_version_name(sender))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def catalog_changed(sender, instance, **kwargs):
+    """Новая версия каталога тегов или ингредиентов."""
+    bump_version(model_version_name(sender))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+def user_list_changed(sender, instance, **kwargs):
+    """Сброс персональных кэшей пользователя."""
+    bump_version(user_version_name(instance.user_id))
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    """Новая дата изменения рецепта при изменении его ингредиентов."""
+    if not is_deleted_with_parent(instance):
+        touch_recipes(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    """Новая дата изменения рецептов с изменёнными тегами и ингредиентами."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        instance.save(update_fields=['updated'])
+    elif pk_set:
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+    else:
+        touch_recipes(instance.recipes.all())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def catalog_item_changed(sender, instance, created, **kwargs):
+    """Новая дата изменения рецептов с изменённым тегом или ингредиентом."""
+    if not created:
+        touch_recipes(instance.recipes.all())
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, **kwargs):
+    """
+    Новая дата изменения рецептов автора.
+
+    Только если изменились поля профиля, которые есть в представлении
+    рецепта. Один UPDATE по author_id; у автора без рецептов он
+    не затрагивает строк и ничего не сбрасывает.
+    """
+    if not created and instance.changed_fields(AUTHOR_FIELDS):
+        touch_recipes(Recipe.objects.filter(author=instance))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    """Раскладка нового рецепта по лентам подписчиков."""
+    if created:
+        fan_out_recipe(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, **kwargs):
+    """Создание уменьшенных копий новой фотографии после коммита."""
+    if getattr(instance, 'image_changed', False) and instance.image:
+        recipe_id = instance.id
+        transaction.on_commit(lambda: schedule_variants(recipe_id))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_item_added(sender, instance, created, **kwargs):
+    """Добавление ингредиентов рецепта в список покупок."""
+    if created:
+        update_shopping_lists([instance.recipe_id], 1, instance.user_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def cart_item_removed(sender, instance, **kwargs):
+    """
+    Вычитание ингредиентов рецепта из списка покупок.
+
+    Только для прямого удаления из корзины: при удалении рецепта или
+    пользователя списки поправляет их pre_delete.
+    """
+    if not is_deleted_with_parent(instance):
+        update_shopping_lists([instance.recipe_id], -1, instance.user_id)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    """Новая дата изменения рецептов с удаляемым ингредиентом."""
+    touch_recipes(instance.recipes.all())
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    """
+    Вычитание рецепта из списков покупок всех, у кого он в корзине.
+
+    Одним вызовом для всех корзин, пока ингредиенты рецепта ещё
+    в базе. Рецепты удаляемого автора обрабатывает user_deleting.
+    """
+    if not is_deleted_with_parent(instance):
+        update_shopping_lists([instance.id], -1)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    """
+    Работа за строки, удаляемые каскадом вместе с пользователем.
+
+    Рецепты пользователя вычитаются из чужих списков покупок,
+    счётчики рецептов и авторов из его избранного, корзины и подписок
+    уменьшаются по одному UPDATE на счётчик. Авторы, вернувшиеся
+    к раскладке по лентам, запоминаются для user_deleted.
+    """
+    update_shopping_lists(
+        Recipe.objects.filter(author=instance).values_list('id', flat=True),
+        -1
+    )
+    for model in (Favorite, ShoppingCart, Follow):
+        release_counters(model, user=instance)
+    instance.authors_at_limit = get_authors_at_limit(instance.id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """Дополнение лент подписчиков авторов, вернувшихся к раскладке."""
+    for author_id in getattr(instance, 'authors_at_limit', ()):
+        refill_feeds(author_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_save, sender=Recipe)
+def counted_row_created(sender, instance, created, **kwargs):
+    """Увеличение денормализованного счётчика."""
+    if created:
+        change_counters(sender, [counted_object_id(instance)], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+@receiver(post_delete, sender=Recipe)
+def counted_row_deleted(sender, instance, **kwargs):
+    """
+    Уменьшение денормализованного счётчика.
+
+    Строки, удалённые каскадом, учитывает user_deleting, либо их
+    счётчик принадлежал удалённому рецепту или пользователю.
+    """
+    if not is_deleted_with_parent(instance):
+        change_counters(sender, [counted_object_id(instance)], -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    """
+    Заполнение ленты рецептами автора после подписки.
+
+    Зарегистрирован после counted_row_created, чтобы видеть
+    обновлённый счётчик подписчиков.
+    """
+    if created:
+        backfill_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """
+    Очистка ленты от рецептов автора после отписки.
+
+    Зарегистрирован после counted_row_deleted, чтобы видеть
+    обновлённый счётчик подписчиков. Ленты удалённых пользователей
+    и записи удалённых авторов удаляются каскадом.
+    """
+    if not is_deleted_with_parent(instance):
+        trim_feed(instance.user_id, instance.author_id)
@@ -0,0 +1,553 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import (APIRequestFactory, APITestCase,
+                                 force_authenticate)
+
+from api.serializer import UserSubscriptionSerializer
+from api.views import RecipeViewSet, UserViewSet
+
+from recipes.models import (Favorite, Follow, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
+from users.models import User
+
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+def create_recipe(author, ingredients):
+    recipe = Recipe.objects.create(
+        author=author, name='Рецепт', text='Описание', cooking_time=10,
+        image='recipes/images/recipe.png'
+    )
+    IngredientInRecipe.objects.bulk_create(
+        IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=10)
+        for ingredient in ingredients
+    )
+    return recipe
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecipeReadQueriesTest(APITestCase):
+    """Число запросов списка и карточки рецепта не зависит от размера."""
+
+    RECIPES = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.reader = User.objects.create(
+            username='reader', email='reader@example.com'
+        )
+        tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag-{number}')
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(5)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}',
+                text='Описание', cooking_time=10,
+                image='recipes/images/recipe.png'
+            )
+            for number in range(cls.RECIPES)
+        ]
+        for number, recipe in enumerate(cls.recipes):
+            recipe.tags.set(tags[:number % 3 + 1])
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=10
+                )
+                for ingredient in ingredients[:number % 5 + 1]
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_get_queries(self, number, url):
+        with self.assertNumQueries(number):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assert_list_queries(self, cold, warm):
+        for limit in (6, self.RECIPES):
+            cache.clear()
+            url = f'/api/recipes/?limit={limit}'
+            response = self.assert_get_queries(cold, url)
+            self.assertEqual(len(response.data['results']), limit)
+            self.assert_get_queries(warm, url)
+
+    def test_list_anonymous(self):
+        self.assert_list_queries(cold=6, warm=2)
+
+    def test_list_authenticated(self):
+        self.client.force_authenticate(self.reader)
+        self.assert_list_queries(cold=7, warm=2)
+
+    def test_detail(self):
+        self.client.force_authenticate(self.reader)
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.assert_get_queries(6, url)
+        self.assert_get_queries(2, url)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecipeListConditionalGetTest(APITestCase):
+    """ETag отфильтрованного списка меняется вместе с его составом."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        self.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f't{number}')
+            for number in range(2)
+        ]
+        ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        self.older, self.newer = [
+            create_recipe(self.author, [ingredient]) for _ in range(2)
+        ]
+        for recipe in (self.older, self.newer):
+            recipe.tags.set([self.tags[0]])
+        self.client.force_authenticate(self.author)
+
+    def test_recipe_leaving_filtered_list(self):
+        url = '/api/recipes/?tags=t0'
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 2)
+        etag = response['ETag']
+
+        response = self.client.patch(
+            f'/api/recipes/{self.older.id}/', {
+                'tags': [self.tags[1].id],
+                'ingredients': [{
+                    'id': self.older.ingredients.get().id, 'amount': 10
+                }],
+            }, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.newer.id]
+        )
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IngredientUpdateQueriesTest(APITestCase):
+    """Число запросов при PATCH рецепта в зависимости от изменений."""
+
+    def setUp(self):
+        self.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        self.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/recipe.png'
+        )
+        self.recipe.tags.set([self.tag])
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=self.recipe, ingredient=ingredient, amount=10
+            )
+            for ingredient in self.ingredients[:2]
+        )
+        self.client.force_authenticate(self.author)
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def patch(self, amounts):
+        return self.client.patch(self.url, {
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in amounts
+            ],
+        }, format='json')
+
+    def assert_patch_queries(self, number, amounts):
+        with self.assertNumQueries(number):
+            response = self.patch(amounts)
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_unchanged(self):
+        self.assert_patch_queries(11, [
+            (self.ingredients[0], 10), (self.ingredients[1], 10)
+        ])
+
+    def test_changed_amount(self):
+        self.assert_patch_queries(13, [
+            (self.ingredients[0], 20), (self.ingredients[1], 10)
+        ])
+
+    def test_added_ingredient(self):
+        self.assert_patch_queries(14, [
+            (self.ingredients[0], 10), (self.ingredients[1], 10),
+            (self.ingredients[2], 10)
+        ])
+
+    def test_removed_ingredient(self):
+        self.assert_patch_queries(13, [(self.ingredients[0], 10)])
+
+    def test_removed_many_ingredients(self):
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=self.recipe, amount=10,
+                ingredient=Ingredient.objects.create(
+                    name=f'Лишний ингредиент {number}', measurement_unit='г'
+                )
+            )
+            for number in range(20)
+        )
+        self.assert_patch_queries(13, [(self.ingredients[0], 10)])
+
+    def test_changed_amount_in_cart(self):
+        ShoppingCart.objects.create(user=self.author, recipe=self.recipe)
+        self.assert_patch_queries(18, [
+            (self.ingredients[0], 20), (self.ingredients[1], 10)
+        ])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ToggleQueriesTest(APITestCase):
+    """Число запросов одиночного добавления и удаления связей."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        self.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        self.recipe = create_recipe(self.author, [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(2)
+        ])
+        self.client.force_authenticate(self.user)
+
+    def assert_toggle_queries(self, url, created, deleted):
+        with self.assertNumQueries(created):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        with self.assertNumQueries(deleted):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, 204)
+
+    def test_favorite(self):
+        self.assert_toggle_queries(
+            f'/api/recipes/{self.recipe.id}/favorite/', 5, 5
+        )
+
+    def test_shopping_cart(self):
+        self.assert_toggle_queries(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/', 7, 7
+        )
+
+    def test_subscribe(self):
+        self.assert_toggle_queries(
+            f'/api/users/{self.author.id}/subscribe/', 10, 7
+        )
+
+
+class OldRecipeViewSet(RecipeViewSet):
+    """Добавление в избранное и корзину, как до перехода на INSERT."""
+
+    def check_recipe_action(self, request, model, serializer_class):
+        recipe = self.get_object()
+        user = request.user
+
+        if request.method == 'POST':
+            _, created = model.objects.get_or_create(
+                user=user, recipe=recipe
+            )
+            if not created:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            data = serializer_class(recipe, context={'request': request}).data
+            return Response(data, status=status.HTTP_201_CREATED)
+
+        row = model.objects.filter(user=user, recipe=recipe).first()
+        if not row:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        row.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class OldUserViewSet(UserViewSet):
+    """Подписка, как до перехода на INSERT."""
+
+    @action(
+        detail=True,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated]
+    )
+    def subscribe(self, request, pk=None):
+        target_user = self.get_object()
+        current_user = request.user
+
+        if request.method == 'DELETE':
+            subscription = target_user.follow.filter(
+                user=current_user
+            ).first()
+            if not subscription:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            subscription.delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if target_user.follow.filter(user=current_user).exists():
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        Follow.objects.create(user=current_user, author=target_user)
+        data = UserSubscriptionSerializer(
+            target_user, context=self.get_serializer_context()
+        ).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TogglesTest(TransactionTestCase):
+    """
+    Добавление и удаление связей вне тестовой транзакции.
+
+    Как в работающем приложении, запросы идут в режиме autocommit.
+    При сравнении числа запросов не учитываются команды управления
+    транзакциями: SQLite, в отличие от PostgreSQL, записывает BEGIN.
+    """
+
+    WORKERS = 8
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        self.users = [
+            User.objects.create(
+                username=f'user{number}', email=f'user{number}@example.com'
+            )
+            for number in range(2)
+        ]
+        self.recipe = create_recipe(self.author, [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(2)
+        ])
+        self.actions = (
+            (RecipeViewSet, OldRecipeViewSet, 'favorite', self.recipe.id),
+            (RecipeViewSet, OldRecipeViewSet, 'shopping_cart',
+             self.recipe.id),
+            (UserViewSet, OldUserViewSet, 'subscribe', self.author.id),
+        )
+
+    def call(self, viewset, name, method, user, pk):
+        """Один запрос к действию viewset от имени user."""
+        request = getattr(APIRequestFactory(), method)(f'/{name}/')
+        force_authenticate(request, user)
+        view = viewset.as_view(
+            {method: name}, **getattr(viewset, name).kwargs
+        )
+        return view(request, pk=pk).status_code
+
+    def count_queries(self, viewset, name, method, pk):
+        with CaptureQueriesContext(connection) as queries:
+            code = self.call(viewset, name, method, self.users[0], pk)
+        self.assertIn(code, (201, 204))
+        return sum(
+            not query['sql'].startswith(TRANSACTION_STATEMENTS)
+            for query in queries
+        )
+
+    def test_fewer_queries_than_old_path(self):
+        user = self.users[0]
+        for viewset, old_viewset, name, pk in self.actions:
+            with self.subTest(action=name):
+                new_post = self.count_queries(viewset, name, 'post', pk)
+                self.call(viewset, name, 'delete', user, pk)
+                old_post = self.count_queries(old_viewset, name, 'post', pk)
+                new_delete = self.count_queries(viewset, name, 'delete', pk)
+                self.call(viewset, name, 'post', user, pk)
+                old_delete = self.count_queries(
+                    old_viewset, name, 'delete', pk
+                )
+                self.assertLess(new_post, old_post)
+                self.assertLess(new_delete, old_delete)
+
+    def race(self, viewset, name, method, user, pk):
+        """Один и тот же запрос одновременно из WORKERS потоков."""
+        barrier = threading.Barrier(self.WORKERS)
+
+        def worker():
+            try:
+                barrier.wait()
+                return self.call(viewset, name, method, user, pk)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+            futures = [
+                executor.submit(worker) for _ in range(self.WORKERS)
+            ]
+            return sorted(future.result() for future in futures)
+
+    @skipIf(connection.vendor == 'sqlite', 'SQLite блокирует таблицы целиком.')
+    def test_concurrent_duplicates(self):
+        losers = [400] * (self.WORKERS - 1)
+        for viewset, _, name, pk in self.actions:
+            for user in self.users:
+                with self.subTest(action=name, user=user.username):
+                    self.assertEqual(
+                        self.race(viewset, name, 'post', user, pk),
+                        [201, *losers]
+                    )
+            self.assert_counters(len(self.users))
+
+        for viewset, _, name, pk in self.actions:
+            for user in self.users:
+                with self.subTest(action=name, user=user.username):
+                    self.assertEqual(
+                        self.race(viewset, name, 'delete', user, pk),
+                        [204, *losers]
+                    )
+        self.assert_counters(0)
+
+    def assert_counters(self, expected):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        rows = (
+            (self.recipe.favorites_count,
+             Favorite.objects.filter(recipe=self.recipe)),
+            (self.recipe.cart_count,
+             ShoppingCart.objects.filter(recipe=self.recipe)),
+            (self.author.followers_count,
+             Follow.objects.filter(author=self.author)),
+        )
+        for counter, queryset in rows:
+            self.assertEqual(counter, queryset.count())
+            self.assertLessEqual(counter, expected)
+        self.assertEqual(
+            ShoppingListItem.objects.aggregate(
+                total=Sum('total_amount')
+            )['total'] or 0,
+            20 * self.recipe.cart_count
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CascadeDeleteQueriesTest(APITestCase):
+    """Каскадное удаление не выполняет запросов на каждую строку."""
+
+    ROWS = 100
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        self.users = User.objects.bulk_create(
+            User(username=f'user{number}', email=f'user{number}@example.com')
+            for number in range(self.ROWS)
+        )
+        if not self.users[0].pk:
+            self.users = list(User.objects.exclude(pk=self.author.pk))
+        self.recipe = create_recipe(self.author, [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(2)
+        ])
+        self.other_recipe = create_recipe(
+            self.users[0], Ingredient.objects.all()
+        )
+        for model in (Favorite, ShoppingCart):
+            for user in self.users:
+                model.objects.create(user=user, recipe=self.recipe)
+        for user in self.users:
+            Follow.objects.create(user=user, author=self.author)
+        Favorite.objects.create(user=self.author, recipe=self.other_recipe)
+        ShoppingCart.objects.create(
+            user=self.author, recipe=self.other_recipe
+        )
+        Follow.objects.create(user=self.author, author=self.users[0])
+
+    def test_delete_recipe(self):
+        with self.assertNumQueries(14):
+            self.recipe.delete()
+        self.assertFalse(ShoppingListItem.objects.filter(
+            user__in=self.users[1:]
+        ).exists())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_delete_author(self):
+        with self.assertNumQueries(34):
+            self.author.delete()
+        self.other_recipe.refresh_from_db()
+        self.users[0].refresh_from_db()
+        self.assertEqual(self.other_recipe.favorites_count, 0)
+        self.assertEqual(self.other_recipe.cart_count, 0)
+        self.assertEqual(self.users[0].followers_count, 0)
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+
+class ShoppingListErrorTest(APITestCase):
+    """Ошибки выгрузки списка покупок отдаются в JSON."""
+
+    def test_unauthorized(self):
+        for params in ({}, {'format': 'csv'}, {'format': 'txt'},
+                       {'format': 'json'}):
+            with self.subTest(**params):
+                response = self.client.get(
+                    '/api/recipes/download_shopping_cart/', params
+                )
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertIn('detail', response.json())
+
+    def test_export_keeps_format(self):
+        self.client.force_authenticate(User.objects.create(
+            username='user', email='user@example.com'
+        ))
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'txt'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Type'], 'text/plain; charset=utf-8'
+        )
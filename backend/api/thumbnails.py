@@ -0,0 +1,131 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from recipes.models import Recipe
+
+FORMATS = {
+    'jpeg': ('jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(settings.THUMBNAIL_QUEUE_SIZE)
+
+
+def variant_name(image_name, width, extension):
+    """Имя файла варианта изображения заданной ширины."""
+    directory, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'thumbs', f'{stem}_{width}.{extension}')
+
+
+def render_variant(image, width, image_format):
+    """Байты изображения, уменьшенного до ширины width."""
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background.paste(image, mask=image.getchannel('A'))
+        else:
+            background.paste(image.convert('RGB'))
+        image = background
+    _, options = FORMATS[image_format]
+    output = BytesIO()
+    image.save(output, format=image_format.upper(), **options)
+    return output.getvalue()
+
+
+def generate_variants(recipe_id):
+    """
+    Создаёт варианты изображения рецепта всех ширин и форматов.
+
+    Варианты записываются, только если изображение рецепта за это
+    время не сменилось; дата изменения рецепта обновляется, чтобы
+    сменились ключ кэша представления и ETag. Возвращает словарь
+    вариантов или None.
+    """
+    image_name = Recipe.objects.filter(pk=recipe_id).values_list(
+        'image', flat=True
+    ).first()
+    if not image_name:
+        return None
+
+    try:
+        with default_storage.open(image_name) as file:
+            image = Image.open(file)
+            image.load()
+    except (OSError, UnidentifiedImageError):
+        return None
+
+    variants = {}
+    for image_format, (extension, _) in FORMATS.items():
+        variants[image_format] = {}
+        for width in settings.THUMBNAIL_WIDTHS:
+            name = variant_name(image_name, width, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            variants[image_format][str(width)] = default_storage.save(
+                name, ContentFile(render_variant(image, width, image_format))
+            )
+
+    Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        image_variants=variants, updated=timezone.now()
+    )
+    return variants
+
+
+def _run(recipe_id):
+    try:
+        generate_variants(recipe_id)
+    except DatabaseError:
+        pass
+    finally:
+        connection.close()
+        _slots.release()
+
+
+def schedule_variants(recipe_id):
+    """
+    Ставит создание вариантов в очередь пула потоков.
+
+    Пул ограничен THUMBNAIL_WORKERS потоками, очередь —
+    THUMBNAIL_QUEUE_SIZE задачами; при переполнении задача
+    пропускается и выполняется командой backfill_thumbnails.
+    """
+    global _executor
+    if not _slots.acquire(blocking=False):
+        return False
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+    _executor.submit(_run, recipe_id)
+    return True
+
+
+def variant_urls(recipe, request=None):
+    """URL вариантов изображения рецепта, абсолютные при наличии request."""
+    urls = {}
+    for image_format, widths in (recipe.image_variants or {}).items():
+        urls[image_format] = {}
+        for width, name in widths.items():
+            url = default_storage.url(name)
+            urls[image_format][width] = (
+                request.build_absolute_uri(url) if request else url
+            )
+    return urls
@@ -32,6 +32,8 @@ urlpatterns = [
         djoser_views.UserViewSet.as_view({"post": "set_password"}),
         name="user-set-password"
     ),
-    path("s/<str:short_id>/", redirect_to_recipe, name="short-link-redirect"),
+    path(
+        "s/<str:short_code>/", redirect_to_recipe, name="short-link-redirect"
+    ),
 
 ]
@@ -1,13 +1,13 @@
-import csv
-from io import StringIO
-
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import redirect, get_object_or_404
+from django.db.models import BooleanField, Exists, Max, OuterRef, Value
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import (AllowAny,
                                         IsAuthenticated,
                                         IsAuthenticatedOrReadOnly
@@ -16,16 +16,30 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from api.analytics import recipe_stats
+from api.cache import (bump_version, get_version, model_version_name,
+                       user_version_name)
+from api.catalog import (ingredient_index, rendered_ingredients,
+                         rendered_tags, tag_catalog)
+from api.counters import change_counters
 from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import CustomPagination
-from api.permissions import IsAuthorOrReadOnly
-from api.mixins import RecipeActionMixin
+from api.feed import backfill_feed, get_merged_authors, trim_feed
+from api.pagination import CustomPagination, FeedPagination
+from api.permissions import IsAuthor, IsAuthorOrReadOnly
+from api.ranking import ORDERINGS, get_ranking
+from api.mixins import (ConditionalGetMixin, RecipeActionMixin, delete_rows,
+                        insert_ignore_conflicts)
+from api.renderers import SHOPPING_LIST_RENDERERS
+from api.short_links import encode_recipe_id, resolve_short_code
+from constant import SHOPPING_LIST_CHUNK_SIZE
 from recipes.models import (
     Favorite,
+    FeedEntry,
     Ingredient,
-    IngredientInRecipe,
     Recipe,
+    RecipeStats,
     ShoppingCart,
+    ShoppingListItem,
     Follow,
     Tag
 )
@@ -33,6 +47,7 @@ from .serializer import (
     AvatarSerializer,
     FavoriteShoppingCartSerializer,
     IngredientSerializer,
+    RecipeIdsSerializer,
     RecipeSerializer,
     TagSerializer,
     UserRegistrationSerializer,
@@ -43,11 +58,16 @@ from .serializer import (
 
 User = get_user_model()
 
+RANKING_PARAMS = ('ordering', 'tags', 'page', 'limit')
+
 
 def redirect_to_recipe(request, short_code):
     """Перенаправление на полный URL рецепта по короткому коду."""
-    recipe = get_object_or_404(Recipe, short_code=short_code)
-    return redirect(f'/recipes/{recipe.id}')
+    recipe_id = resolve_short_code(short_code)
+    if recipe_id is None:
+        raise Http404
+    recipe_stats.add(recipe_id, 'clicks')
+    return redirect(f'/recipes/{recipe_id}')
 
 
 class UserViewSet(ModelViewSet):
@@ -57,6 +77,8 @@ class UserViewSet(ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = CustomPagination
+    cursor_ordering = ('id',)
+    user_scoped_count_actions = ('subscriptions',)
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -92,31 +114,33 @@ class UserViewSet(ModelViewSet):
         current_user = request.user
 
         if request.method == 'DELETE':
-            subscription = target_user.follower.filter(
-                user=current_user
-            ).first()
+            with transaction.atomic():
+                if not delete_rows(Follow, user_id=current_user.id,
+                                   author_id=target_user.id):
+                    return Response(
+                        {'detail': 'Подписка не найдена.'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                change_counters(Follow, [target_user.id], -1)
+
+            bump_version(user_version_name(current_user.id))
+            trim_feed(current_user.id, target_user.id)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        context = self.get_serializer_context()
+        context['recipes_limit'] = self.get_recipes_limit(request)
 
-            if not subscription:
+        with transaction.atomic():
+            if not insert_ignore_conflicts(Follow, user_id=current_user.id,
+                                           author_id=target_user.id):
                 return Response(
-                    {'detail': 'Подписка не найдена.'},
+                    {'detail': 'Вы уже подписаны на этого пользователя.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            change_counters(Follow, [target_user.id], 1)
 
-            subscription.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-
-        if target_user.follower.filter(
-                user=current_user).exists():
-            return Response(
-                {'detail': 'Вы уже подписаны на этого пользователя.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        Follow.objects.create(user=current_user, author=target_user)
-
-        context = self.get_serializer_context()
-        context['recipes_limit'] = request.query_params.get('recipes_limit')
-
+        bump_version(user_version_name(current_user.id))
+        backfill_feed(current_user.id, target_user.id)
         user_data = UserSubscriptionSerializer(
             target_user, context=context).data
         return Response(user_data, status=status.HTTP_201_CREATED)
@@ -128,13 +152,10 @@ class UserViewSet(ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def subscriptions(self, request):
-        user = request.user
-        author_ids = user.follow.values_list('author', flat=True)
-
-        authors = User.objects.filter(id__in=author_ids)
+        authors = User.objects.filter(follow__user=request.user)
 
         context = self.get_serializer_context()
-        context['recipes_limit'] = request.query_params.get('recipes_limit')
+        context['recipes_limit'] = self.get_recipes_limit(request)
 
         page = self.paginate_queryset(authors)
         if page is not None:
@@ -148,6 +169,23 @@ class UserViewSet(ModelViewSet):
         )
         return Response(serializer.data)
 
+    @staticmethod
+    def get_recipes_limit(request):
+        """Проверенное значение recipes_limit из запроса."""
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+
+        try:
+            recipes_limit = int(recipes_limit)
+            if recipes_limit < 0:
+                raise ValueError
+        except ValueError:
+            raise ValidationError(
+                {'recipes_limit': 'recipes_limit должен быть числом.'}
+            )
+        return recipes_limit
+
 
 class UserSelfView(APIView):
     """получения данных аутентифицированного текущего пользователя."""
@@ -181,7 +219,7 @@ class UserAvatarView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(ConditionalGetMixin, ModelViewSet):
     """Работы с тегами."""
 
     queryset = Tag.objects.all()
@@ -190,8 +228,26 @@ class TagViewSet(ModelViewSet):
     http_method_names = ['get']
     pagination_class = None
 
+    def get_conditional_state(self, request):
+        return None, [get_version(model_version_name(Tag))]
+
+    def get_encoding_variant(self, request):
+        return rendered_tags.encoding(request) if self.action == 'list' else ''
 
-class RecipeViewSet(ModelViewSet, RecipeActionMixin):
+    def list_response(self, request, *args, **kwargs):
+        response = rendered_tags.response(request)
+        if response is None:
+            response = Response(tag_catalog.all())
+        return response
+
+    def retrieve_response(self, request, pk=None):
+        tag = tag_catalog.get(pk)
+        if tag is None:
+            raise NotFound
+        return Response(tag)
+
+
+class RecipeViewSet(ConditionalGetMixin, ModelViewSet, RecipeActionMixin):
     """Управление рецептами."""
 
     queryset = Recipe.objects.all()
@@ -201,10 +257,114 @@ class RecipeViewSet(ModelViewSet, RecipeActionMixin):
     http_method_names = ['get', 'post', 'patch', 'delete']
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
+    user_dependent_etag = True
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Recipe.objects.select_related('author')
+
+        if user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Exists(Favorite.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+                is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                ))
+            )
+
+        return queryset.annotate(
+            is_favorited=Value(False, output_field=BooleanField()),
+            is_in_shopping_cart=Value(False, output_field=BooleanField())
+        )
+
+    def get_conditional_state(self, request):
+        """
+        Состояние списка — последнее изменение по всей таблице.
+
+        Изменённый рецепт может выйти из отфильтрованного списка или
+        попасть в него, поэтому MAX(updated) по отфильтрованным строкам
+        для списка не годится.
+        """
+        queryset = Recipe.objects.all()
+        try:
+            if self.action == 'retrieve':
+                queryset = queryset.filter(pk=self.kwargs['pk'])
+            updated = queryset.aggregate(updated=Max('updated'))['updated']
+        except ValueError:
+            return None
+
+        versions = [get_version(model_version_name(Recipe))]
+        if request.user.is_authenticated:
+            versions.append(get_version(user_version_name(request.user.pk)))
+        ranking = self.get_ranking()
+        if ranking is not None:
+            versions.append(ranking.stamp)
+        return updated, versions
+
+    def get_ranking(self):
+        """Рейтинг для ?ordering=popular|-favorites|trending или None."""
+        if self.action != 'list':
+            return None
+        kind = ORDERINGS.get(self.request.query_params.get('ordering'))
+        if kind is None:
+            return None
+        tags = self.request.query_params.getlist('tags')
+        return get_ranking(kind, tag_catalog.ids_for_slugs(tags))
+
+    def list_response(self, request, *args, **kwargs):
+        """
+        Для сортировок по популярности страница берётся из рейтинга.
+
+        Остальные фильтры, кроме тегов, учтённых в самом рейтинге,
+        применяются одним запросом по id из рейтинга.
+        """
+        ranking = self.get_ranking()
+        if ranking is None:
+            return super().list_response(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        ids = ranking.ids
+        if set(request.query_params) - set(RANKING_PARAMS):
+            allowed = set(
+                queryset.filter(pk__in=ids).values_list('pk', flat=True)
+            )
+            ids = [pk for pk in ids if pk in allowed]
+
+        page = self.paginate_queryset(ids)
+        recipes = queryset.in_bulk(page)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in page if pk in recipes], many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            recipe_stats.add(int(kwargs['pk']), 'views')
+        return response
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(
+        detail=True,
+        methods=['get'],
+        permission_classes=[IsAuthenticated, IsAuthor]
+    )
+    def stats(self, request, pk=None):
+        """Переходы по короткой ссылке и просмотры рецепта для автора."""
+        recipe = self.get_object()
+        stats = RecipeStats.objects.filter(recipe=recipe).values(
+            'clicks', 'views'
+        ).first() or {'clicks': 0, 'views': 0}
+        pending = recipe_stats.pending(recipe.id)
+        return Response({
+            'id': recipe.id,
+            **{field: stats[field] + pending[field] for field in stats}
+        })
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -225,6 +385,51 @@ class RecipeViewSet(ModelViewSet, RecipeActionMixin):
             request, ShoppingCart, FavoriteShoppingCartSerializer
         )
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite/bulk'
+    )
+    def favorite_bulk(self, request):
+        return self.bulk_recipe_action(request, Favorite, RecipeIdsSerializer)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart/bulk'
+    )
+    def shopping_cart_bulk(self, request):
+        return self.bulk_recipe_action(
+            request, ShoppingCart, RecipeIdsSerializer
+        )
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь."""
+        user = request.user
+        sources = [
+            (FeedEntry.objects.filter(user=user), ('-created', '-recipe_id'))
+        ]
+        merged_authors = get_merged_authors(user)
+        if merged_authors:
+            sources.append((
+                Recipe.objects.filter(author_id__in=merged_authors),
+                ('-created', '-id')
+            ))
+
+        paginator = FeedPagination()
+        page = paginator.paginate_sources(
+            sources, self.get_queryset().in_bulk, request
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         methods=['get'],
@@ -233,59 +438,49 @@ class RecipeViewSet(ModelViewSet, RecipeActionMixin):
     def get_link(self, request, pk=None):
         """Возвращает короткую ссылку на рецепт."""
         recipe = self.get_object()
-        link = request.build_absolute_uri(f'/api/r/{recipe.short_code}')
+        link = request.build_absolute_uri(reverse(
+            'short-link-redirect',
+            kwargs={'short_code': encode_recipe_id(recipe.id)}
+        ))
         return Response({'short-link': link})
 
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=SHOPPING_LIST_RENDERERS
     )
     def download_shopping_cart(self, request):
-        user = request.user
+        """
+        Выгрузка списка покупок в формате из ?format=: csv, txt или json.
+
+        Строки читаются из базы порциями и сразу отдаются клиенту.
+        """
         ingredients = (
-            IngredientInRecipe.objects
-            .filter(recipe__in_shopping_cart__user=user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
+            ShoppingListItem.objects
+            .filter(user=request.user)
+            .values(
+                'ingredient__name', 'ingredient__measurement_unit',
+                'total_amount'
+            )
             .order_by('ingredient__name')
+            .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
         )
-
-        output = StringIO()
-        output.write('\ufeff')
-
-        writer = csv.writer(output)
-        writer.writerow(['Ингредиенты', 'Количество'])
-
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            unit = ingredient['ingredient__measurement_unit']
-            total_amount = ingredient['total_amount']
-            writer.writerow([f'{name} ({unit})', total_amount])
-
-        response = HttpResponse(
-            output.getvalue(), content_type='text/csv; charset=utf-8'
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            (
+                chunk.encode(renderer.charset)
+                for chunk in renderer.stream(ingredients)
+            ),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
         )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.csv"'
+            f'attachment; filename="shopping_cart.{renderer.format}"'
         )
         return response
 
-    @staticmethod
-    def ingredients_to_txt(ingredients):
-        """Объединение ингредиентов в список для загрузки"""
-
-        shopping_list = ''
-        for ingredient in ingredients:
-            shopping_list += (
-                f"{ingredient['ingredient__name']}  - "
-                f"{ingredient['sum']}"
-                f"({ingredient['ingredient__measurement_unit']})\n"
-            )
-        return shopping_list
-
 
-class IngredientViewSet(ModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, ModelViewSet):
     """Управление ингредиентами."""
 
     queryset = Ingredient.objects.all()
@@ -295,4 +490,28 @@ class IngredientViewSet(ModelViewSet):
     filter_backends = (DjangoFilterBackend, )
     pagination_class = None
     filterset_class = IngredientFilter
-    search_fields = ('^name', )
+
+    def get_conditional_state(self, request):
+        return None, [get_version(model_version_name(Ingredient))]
+
+    def get_encoding_variant(self, request):
+        if self.action != 'list':
+            return ''
+        return rendered_ingredients.encoding(request)
+
+    def list_response(self, request, *args, **kwargs):
+        response = rendered_ingredients.response(request)
+        if response is not None:
+            return response
+
+        query = request.query_params.get('search')
+        if query is not None:
+            ingredients = ingredient_index.search(query)
+        else:
+            ingredients = ingredient_index.startswith(
+                request.query_params.get('name', '')
+            )
+
+        if ingredients is None:
+            return super().list_response(request, *args, **kwargs)
+        return Response(ingredients)
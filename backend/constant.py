@@ -1,3 +1,9 @@
 MESSAGE = 1
 MAXLEN = 150
 MES_MAX = 32000
+PAGE_SIZE = 6
+MAX_PAGE_SIZE = 100
+INGREDIENT_SEARCH_LIMIT = 20
+SHOPPING_LIST_CHUNK_SIZE = 500
+BASE64_CHUNK_SIZE = 256 * 1024
+BASE64_HEADER_LENGTH = 64
@@ -74,6 +74,19 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='/tmp/foodgram_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '5000')),
+        },
+    }
+}
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -124,3 +137,29 @@ DJOSER = {
 }
 
 CSV_FILES_DIR = os.path.join(BASE_DIR, 'data')
+
+COUNT_CACHE_TTL = int(os.getenv('COUNT_CACHE_TTL', '60'))
+COUNT_ESTIMATE_THRESHOLD = int(os.getenv('COUNT_ESTIMATE_THRESHOLD', '10000'))
+RECIPE_CACHE_TTL = int(os.getenv('RECIPE_CACHE_TTL', '3600'))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', '1000'))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', '50'))
+
+BULK_ACTION_LIMIT = int(os.getenv('BULK_ACTION_LIMIT', '100'))
+
+RANKING_SIZE = int(os.getenv('RANKING_SIZE', '1000'))
+RANKING_CACHE_TTL = int(os.getenv('RANKING_CACHE_TTL', '300'))
+TRENDING_DAYS = int(os.getenv('TRENDING_DAYS', '7'))
+
+SHORT_LINK_SALT = os.getenv('SHORT_LINK_SALT', 'foodgram')
+SHORT_LINK_MIN_LENGTH = 8
+
+STATS_FLUSH_INTERVAL = int(os.getenv('STATS_FLUSH_INTERVAL', '10'))
+STATS_FLUSH_SIZE = int(os.getenv('STATS_FLUSH_SIZE', '500'))
+
+THUMBNAIL_WIDTHS = (320, 640)
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+THUMBNAIL_QUEUE_SIZE = int(os.getenv('THUMBNAIL_QUEUE_SIZE', '100'))
+
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv('IMAGE_UPLOAD_MAX_SIZE', '10485760'))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', '40000000'))
@@ -21,7 +21,7 @@ class RecipeAdmin(ModelAdmin):
     search_fields = ('name', 'author')
 
     def get_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     get_favorites.short_description = (
         'Количество добавлений рецепта в избранное'
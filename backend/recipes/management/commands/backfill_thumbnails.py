@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.thumbnails import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Создаёт уменьшенные копии фотографий рецептов, у которых их нет.
+
+    С флагом --all пересоздаёт копии для всех рецептов.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        count = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            if generate_variants(recipe_id) is not None:
+                count += 1
+        print(f'Обработано фотографий: {count}.')
@@ -0,0 +1,83 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import rolled_back, timings
+from api.cache import bump_version, model_version_name
+from api.catalog import INGREDIENT_FIELDS, IngredientIndex
+from api.filters import IngredientFilter
+from recipes.models import Ingredient
+
+SYLLABLES = (
+    'ка', 'ро', 'ма', 'ли', 'то', 'све', 'мо', 'ра', 'ни', 'пе',
+    'ре', 'ц', 'со', 'ль', 'са', 'хар', 'мас', 'ло', 'му', 'зе'
+)
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает автодополнение ингредиентов по индексу в памяти и в базе.
+
+    Синтетические ингредиенты создаются в транзакции, которая после
+    замера откатывается. Запросы по префиксу (?name=) и по подстроке
+    (?search=) выполняются через индекс и через IngredientFilter.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with rolled_back():
+            names = self.create_data(rng, options['ingredients'])
+            bump_version(model_version_name(Ingredient))
+            index = IngredientIndex()
+            build_median, _ = timings(index.build, options['repeat'])
+            print(f'Построение индекса: медиана {build_median:.2f} мс.')
+            if index.startswith('') is None:
+                raise CommandError('Индекс устарел во время замера.')
+
+            queries = [
+                rng.choice(names)[:rng.randint(1, 4)]
+                for _ in range(options['queries'])
+            ]
+            self.measure('name', queries, index.startswith, options)
+            self.measure('search', queries, index.search, options)
+        bump_version(model_version_name(Ingredient))
+
+    def create_data(self, rng, count):
+        names = sorted({
+            ' '.join(
+                ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+                for _ in range(rng.randint(1, 3))
+            ).capitalize()
+            for _ in range(count)
+        })
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in names
+        )
+        print(f'Создано ингредиентов: {len(names)}.')
+        return names
+
+    def measure(self, param, queries, search, options):
+        def run_index():
+            for query in queries:
+                search(query)
+
+        def run_database():
+            for query in queries:
+                list(IngredientFilter(
+                    {param: query}, queryset=Ingredient.objects.all()
+                ).qs.values(*INGREDIENT_FIELDS))
+
+        repeat = options['repeat']
+        for source, run in (('индекс', run_index), ('база', run_database)):
+            median, minimum = timings(run, repeat)
+            print(
+                f'?{param}=, {source}: {len(queries)} запросов '
+                f'за {median:.2f} мс (медиана), минимум {minimum:.2f} мс, '
+                f'{median / len(queries):.3f} мс на запрос.'
+            )
@@ -0,0 +1,165 @@
+import csv
+import gc
+import resource
+import tracemalloc
+from io import StringIO
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.http import HttpResponse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.benchmarks import rolled_back
+from api.shopping_list import update_shopping_lists
+from api.views import RecipeViewSet
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart)
+from users.models import User
+
+
+def reset_peak_rss():
+    """Сбрасывает пиковый RSS процесса, если ядро Linux это позволяет."""
+    gc.collect()
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """Пиковый RSS процесса в килобайтах."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def baseline_export(user):
+    """
+    Выгрузка, как до потоковой: сумма по корзине в StringIO.
+
+    Прежняя выгрузка поддерживала только CSV и собирала документ
+    целиком в памяти перед отправкой.
+    """
+    ingredients = (
+        IngredientInRecipe.objects
+        .filter(recipe__shopping_recipe__user=user)
+        .values('ingredient__name', 'ingredient__measurement_unit')
+        .annotate(total_amount=Sum('amount'))
+        .order_by('ingredient__name')
+    )
+    output = StringIO()
+    output.write('\ufeff')
+    writer = csv.writer(output)
+    writer.writerow(['Ингредиенты', 'Количество'])
+    for ingredient in ingredients:
+        name = ingredient['ingredient__name']
+        unit = ingredient['ingredient__measurement_unit']
+        writer.writerow([f'{name} ({unit})', ingredient['total_amount']])
+    response = HttpResponse(
+        output.getvalue(), content_type='text/csv; charset=utf-8'
+    )
+    response['Content-Disposition'] = (
+        'attachment; filename="shopping_cart.csv"'
+    )
+    return response
+
+
+class Command(BaseCommand):
+    """
+    Замеряет память при выгрузке большого списка покупок в CSV.
+
+    Синтетические рецепты в корзине создаются в транзакции, которая
+    после замера откатывается. Потоковая выгрузка через
+    download_shopping_cart сравнивается с прежней выгрузкой через
+    StringIO и HttpResponse. Где пиковый RSS нельзя сбросить, он
+    только растёт, поэтому поток замеряется первым.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=20000)
+        parser.add_argument('--per-recipe', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            user = self.create_data(options['items'], options['per_recipe'])
+            request = APIRequestFactory().get(
+                '/api/recipes/download_shopping_cart/', {'format': 'csv'}
+            )
+            force_authenticate(request, user)
+            view = RecipeViewSet.as_view(
+                {'get': 'download_shopping_cart'},
+                **RecipeViewSet.download_shopping_cart.kwargs
+            )
+
+            def streamed():
+                response = view(request)
+                return sum(len(chunk) for chunk in response.streaming_content)
+
+            def baseline():
+                return len(baseline_export(user).content)
+
+            tracemalloc.start()
+            for name, export in (('поток', streamed),
+                                 ('StringIO', baseline)):
+                self.measure(name, export)
+            tracemalloc.stop()
+
+    def create_data(self, count, per_recipe):
+        """Рецепты по per_recipe ингредиентов, все в корзине user."""
+        user = User.objects.create(
+            username='benchmark', email='benchmark@example.com'
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'Ингредиент для замера выгрузки {number}',
+                measurement_unit='г'
+            )
+            for number in range(count)
+        )
+        ingredient_ids = list(Ingredient.objects.filter(
+            name__startswith='Ингредиент для замера выгрузки'
+        ).values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=user, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/images/benchmark.png'
+            )
+            for number in range(0, count, per_recipe)
+        )
+        recipe_ids = list(
+            Recipe.objects.filter(author=user).values_list('id', flat=True)
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe_id=recipe_id, ingredient_id=ingredient_id, amount=100
+            )
+            for recipe_id, start in zip(
+                recipe_ids, range(0, count, per_recipe)
+            )
+            for ingredient_id in ingredient_ids[start:start + per_recipe]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe_id=recipe_id)
+            for recipe_id in recipe_ids
+        )
+        update_shopping_lists(recipe_ids, 1, user.id)
+        print(f'Создано строк списка покупок: {count}.')
+        return user
+
+    def measure(self, name, export):
+        reset_peak_rss()
+        rss_before = peak_rss()
+        tracemalloc.reset_peak()
+        size = export()
+        _, peak = tracemalloc.get_traced_memory()
+        print(
+            f'{name}: {size} байт, пик Python-аллокаций '
+            f'{peak / 1024:.0f} КБ, рост пикового RSS '
+            f'{peak_rss() - rss_before} КБ.'
+        )
@@ -0,0 +1,81 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.http import QueryDict
+
+from api.benchmarks import rolled_back, timings
+from api.cache import bump_version, model_version_name
+from api.filters import RecipeFilter
+from constant import PAGE_SIZE
+from recipes.models import Recipe, Tag
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает стоимость фильтра рецептов по трём тегам и по одному.
+
+    Синтетические рецепты создаются в транзакции, которая после
+    замера откатывается. Замеряются страница списка и COUNT(*)
+    пагинатора.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            slugs = self.create_data(options)
+            bump_version(model_version_name(Tag))
+            for count in (1, 3):
+                self.measure(slugs[:count], options['repeat'])
+        bump_version(model_version_name(Tag))
+
+    def create_data(self, options):
+        rng = random.Random(options['seed'])
+        author = User.objects.create(
+            username='benchmark', email='benchmark@example.com'
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', slug=f'benchmark-{number}')
+            for number in range(options['tags'])
+        )
+        if tags and not tags[0].pk:
+            tags = list(Tag.objects.filter(slug__startswith='benchmark-'))
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/images/benchmark.png'
+            )
+            for number in range(options['recipes'])
+        )
+        if recipes and not recipes[0].pk:
+            recipes = list(Recipe.objects.filter(author=author))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag.pk)
+            for recipe in recipes
+            for tag in rng.sample(tags, rng.randint(1, min(3, len(tags))))
+        )
+        print(
+            f'Создано рецептов: {len(recipes)}, тегов: {len(tags)}.'
+        )
+        return [tag.slug for tag in tags]
+
+    def measure(self, slugs, repeat):
+        data = QueryDict(mutable=True)
+        data.setlist('tags', slugs)
+        queryset = RecipeFilter(data, queryset=Recipe.objects.all()).qs
+        page_median, page_min = timings(
+            lambda: list(queryset[:PAGE_SIZE]), repeat
+        )
+        count_median, count_min = timings(queryset.count, repeat)
+        print(
+            f'Тегов в фильтре: {len(slugs)}; '
+            f'страница: медиана {page_median:.2f} мс, '
+            f'минимум {page_min:.2f} мс; '
+            f'COUNT(*): медиана {count_median:.2f} мс, '
+            f'минимум {count_min:.2f} мс.'
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.analytics import request_flush
+
+
+class Command(BaseCommand):
+    """Просит процессы приложения записать буферы статистики рецептов."""
+
+    def handle(self, *args, **options):
+        request_flush()
+        print('Запрошена запись статистики рецептов.')
@@ -1,6 +1,7 @@
 import csv
 from django.core.management.base import BaseCommand
 
+from api.cache import bump_version, model_version_name
 from recipes.models import Ingredient
 
 
@@ -9,15 +10,30 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         self.import_ingredients()
+        bump_version(model_version_name(Ingredient))
         print('Загрузка ингредиентов для базы данных завершена.')
 
     def import_ingredients(self, file='ingredients.csv'):
+        """
+        Добавляет отсутствующие ингредиенты одним bulk_create.
+
+        Сигналы по строкам не отправляются: версия каталога
+        обновляется один раз после загрузки.
+        """
         print(f'Загрузка {file}...')
         file_path = f'./data/{file}'
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
         with open(file_path, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                status, created = Ingredient.objects.update_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
-                )
+            rows = dict.fromkeys(
+                (name, unit) for name, unit in csv.reader(f)
+                if (name, unit) not in existing
+            )
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in rows
+            ],
+            batch_size=1000
+        )
@@ -1,6 +1,7 @@
 import csv
 from django.core.management.base import BaseCommand
 
+from api.cache import bump_version, model_version_name
 from recipes.models import Tag
 
 
@@ -9,15 +10,18 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         self.import_tags()
+        bump_version(model_version_name(Tag))
         print('Загрузка тегов для базы данных завершена.')
 
     def import_tags(self, file='tags.csv'):
+        """
+        Добавляет отсутствующие теги одним bulk_create.
+
+        Сигналы по строкам не отправляются: версия каталога
+        обновляется один раз после загрузки.
+        """
         print(f'Загрузка {file}...')
         file_path = f'./data/{file}'
         with open(file_path, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                status, created = Tag.objects.update_or_create(
-                    name=row[0],
-                    slug=row[1]
-                )
+            tags = [Tag(name=name, slug=slug) for name, slug in csv.reader(f)]
+        Tag.objects.bulk_create(tags, ignore_conflicts=True)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.shopping_list import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    """Пересобирает списки покупок пользователей по их корзинам."""
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_shopping_lists()
+        print(f'Списки покупок пересобраны, строк: {count}.')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.ranking import POPULAR, TRENDING, refresh_ranking
+from recipes.models import Tag
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает рейтинги рецептов для списка без тегов и каждого тега.
+
+    Запускается по расписанию, чаще чем RANKING_CACHE_TTL.
+    """
+
+    def handle(self, *args, **options):
+        tag_sets = [()] + [
+            (pk,) for pk in Tag.objects.values_list('id', flat=True)
+        ]
+        for kind in (POPULAR, TRENDING):
+            for tag_ids in tag_sets:
+                refresh_ranking(kind, tag_ids)
+        print(f'Пересчитано рейтингов: {2 * len(tag_sets)}.')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.counters import repair_counters
+
+
+class Command(BaseCommand):
+    """Пересчитывает денормализованные счётчики рецептов и пользователей."""
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            repaired = repair_counters()
+        for counter, count in repaired.items():
+            print(f'{counter}: исправлено строк {count}.')
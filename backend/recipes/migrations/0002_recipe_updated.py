@@ -0,0 +1,27 @@
+# Generated by Django 3.2.16 on 2026-10-17 07:55
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def fill_updated(apps, schema_editor):
+    """Дата изменения существующих рецептов — дата их публикации."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(updated=F('created'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='updated',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата изменения рецепта'),
+        ),
+        migrations.RunPython(fill_updated, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.16 on 2026-10-17 07:55
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+COUNTERS = (
+    ('Favorite', 'recipes.Recipe', 'favorites_count', 'recipe'),
+    ('ShoppingCart', 'recipes.Recipe', 'cart_count', 'recipe'),
+    ('Follow', 'users.User', 'followers_count', 'author'),
+    ('Recipe', 'users.User', 'recipes_count', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    """Счётчики существующих рецептов и пользователей."""
+    for model_name, target_label, field, relation in COUNTERS:
+        model = apps.get_model('recipes', model_name)
+        target = apps.get_model(target_label)
+        count = Coalesce(Subquery(
+            model.objects.filter(**{relation: OuterRef('pk')})
+            .order_by().values(relation)
+            .annotate(count=Count('*')).values('count')
+        ), 0)
+        target.objects.update(**{field: count})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_counters'),
+        ('recipes', '0004_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-created'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-cart_count', '-created'], name='recipe_cart_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.16 on 2026-10-17 07:55
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.utils.timezone
+
+
+def fill_created(apps, schema_editor):
+    """
+    Дата добавления существующих записей избранного — дата рецепта.
+
+    Настоящая дата неизвестна, а дата миграции сделала бы все старые
+    записи свежими для рейтинга trending. Запись не старше рецепта,
+    поэтому в окно TRENDING_DAYS попадают только записи рецептов,
+    опубликованных в этом окне.
+    """
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite.objects.update(created=Subquery(
+        Recipe.objects.filter(pk=OuterRef('recipe_id')).values('created')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+        migrations.RunPython(fill_created, migrations.RunPython.noop),
+    ]
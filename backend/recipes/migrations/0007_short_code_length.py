@@ -0,0 +1,40 @@
+# Generated by Django 3.2.16 on 2026-10-17 07:55
+
+from django.conf import settings
+from django.db import migrations, models
+from hashids import Hashids
+
+
+def fill_short_codes(apps, schema_editor):
+    """
+    Коды hashids для рецептов без короткого кода.
+
+    Старые случайные коды не меняются, чтобы выданные ссылки работали.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    hashids = Hashids(
+        salt=settings.SHORT_LINK_SALT,
+        min_length=settings.SHORT_LINK_MIN_LENGTH
+    )
+    recipes = Recipe.objects.filter(short_code__isnull=True).only('id')
+    batch = []
+    for recipe in recipes.iterator():
+        recipe.short_code = hashids.encode(recipe.id)
+        batch.append(recipe)
+    Recipe.objects.bulk_update(batch, ['short_code'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_favorite_created'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_code',
+            field=models.CharField(blank=True, max_length=16, null=True, unique=True, verbose_name='Короткий код'),
+        ),
+        migrations.RunPython(fill_short_codes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.16 on 2026-10-17 07:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_short_code_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStats',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('clicks', models.PositiveBigIntegerField(default=0, verbose_name='Переходы по короткой ссылке')),
+                ('views', models.PositiveBigIntegerField(default=0, verbose_name='Просмотры')),
+            ],
+            options={
+                'verbose_name': 'Статистика рецепта',
+                'verbose_name_plural': 'Статистика рецептов',
+            },
+        ),
+    ]
@@ -1,13 +1,31 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
-from django.utils.crypto import get_random_string
+from django.utils import timezone
 
 from constant import MESSAGE, MES_MAX
+from users.models import LoadedValuesMixin, non_counter_fields
 
 User = get_user_model()
 
 
+def cascade(collector, field, sub_objs, using):
+    """
+    CASCADE, помечающий строки, которые удаляются вместе с родителем.
+
+    Обработчики сигналов таких строк ничего не делают: счётчики, ленты
+    и списки покупок один раз поправляет pre_delete родителя.
+    """
+    for obj in sub_objs:
+        obj.deleted_with_parent = True
+    models.CASCADE(collector, field, sub_objs, using)
+
+
+def is_deleted_with_parent(instance):
+    """Удаляется ли строка каскадом вместе с родителем."""
+    return getattr(instance, "deleted_with_parent", False)
+
+
 class Tag(models.Model):
     """Модель тега."""
     name = models.CharField(
@@ -64,13 +82,13 @@ class Ingredient(models.Model):
         return f"{self.name}, {self.measurement_unit}"
 
 
-class Recipe(models.Model):
+class Recipe(LoadedValuesMixin, models.Model):
     """Модель описания рецепта."""
 
     author = models.ForeignKey(
         User,
         related_name="recipes",
-        on_delete=models.CASCADE,
+        on_delete=cascade,
         verbose_name="Автор рецепта"
     )
     name = models.CharField(
@@ -82,6 +100,12 @@ class Recipe(models.Model):
         upload_to="recipes/",
         blank=True
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Уменьшенные копии фотографии"
+    )
     text = models.TextField(
         verbose_name="Описание рецепта"
     )
@@ -110,7 +134,7 @@ class Recipe(models.Model):
         ]
     )
     short_code = models.CharField(
-        max_length=6,
+        max_length=16,
         unique=True,
         blank=True,
         null=True,
@@ -121,6 +145,24 @@ class Recipe(models.Model):
         db_index=True,
         verbose_name="Дата публикации рецепта"
     )
+    updated = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name="Дата изменения рецепта"
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Добавлений в избранное"
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Добавлений в список покупок"
+    )
+
+    COUNTER_FIELDS = ("favorites_count", "cart_count")
+    BACKGROUND_FIELDS = ("image_variants",)
 
     class Meta:
         """Класс мета."""
@@ -128,22 +170,47 @@ class Recipe(models.Model):
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ("-created",)
+        indexes = [
+            models.Index(
+                fields=["-favorites_count", "-created"],
+                name="recipe_favorites_count_idx"
+            ),
+            models.Index(
+                fields=["-cart_count", "-created"],
+                name="recipe_cart_count_idx"
+            ),
+        ]
 
     def __str__(self):
         """Метод строкового представления модели."""
         return self.name
 
-    def generate_short_code(self):
-        """Генерирует уникальный короткий код."""
-        while True:
-            short_code = get_random_string(length=6)
-            if not Recipe.objects.filter(short_code=short_code).exists():
-                return short_code
-
     def save(self, *args, **kwargs):
-        """Переопределяем метод save для генерации короткого кода."""
-        if not self.short_code:
-            self.short_code = self.generate_short_code()
+        """
+        Обновляет дату изменения.
+
+        Счётчики меняются только через F()-выражения, а уменьшенные
+        копии фотографии пишет фоновая задача, поэтому при сохранении
+        существующего рецепта они не перезаписываются. Копии
+        сбрасываются, только если сменилась сама фотография.
+        """
+        self.updated = timezone.now()
+        update_fields = kwargs.get("update_fields")
+        self.image_changed = bool(self.changed_fields(("image",))) and (
+            update_fields is None or "image" in update_fields
+        )
+        if self.image_changed:
+            self.image_variants = {}
+        if update_fields is None and not self._state.adding:
+            update_fields = [
+                name for name in non_counter_fields(self)
+                if name not in self.BACKGROUND_FIELDS
+            ]
+        if update_fields is not None:
+            update_fields = {*update_fields, "updated"}
+            if self.image_changed:
+                update_fields.update(self.BACKGROUND_FIELDS)
+            kwargs["update_fields"] = update_fields
         super().save(*args, **kwargs)
 
 
@@ -152,13 +219,13 @@ class IngredientInRecipe(models.Model):
 
     recipe = models.ForeignKey(
         Recipe,
-        on_delete=models.CASCADE,
+        on_delete=cascade,
         related_name="ingredient_list",
         verbose_name="Рецепт"
     )
     ingredient = models.ForeignKey(
         Ingredient,
-        on_delete=models.CASCADE,
+        on_delete=cascade,
         verbose_name="Ингредиент",
         related_name="in_recipe"
     )
@@ -226,13 +293,13 @@ class ShoppingCart(models.Model):
 
     user = models.ForeignKey(
         User,
-        on_delete=models.CASCADE,
+        on_delete=cascade,
         related_name="shopping_user",
         verbose_name="Пользователь"
     )
     recipe = models.ForeignKey(
         Recipe,
-        on_delete=models.CASCADE,
+        on_delete=cascade,
         related_name="shopping_recipe",
         verbose_name="Рецепт"
     )
@@ -259,12 +326,12 @@ class Follow(models.Model):
     author = models.ForeignKey(
         User,
         related_name="follow",
-        on_delete=models.CASCADE,
+        on_delete=cascade,
         verbose_name="Автор рецепта",
     )
     user = models.ForeignKey(
         User,
-        on_delete=models.CASCADE,
+        on_delete=cascade,
         related_name="follower",
         verbose_name="Подписчик"
     )
@@ -290,16 +357,21 @@ class Favorite(models.Model):
 
     user = models.ForeignKey(
         User,
-        on_delete=models.CASCADE,
+        on_delete=cascade,
         related_name="favorites",
         verbose_name="Пользователь"
     )
     recipe = models.ForeignKey(
         Recipe,
-        on_delete=models.CASCADE,
+        on_delete=cascade,
         related_name="favorites",
         verbose_name="Рецепт"
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name="Дата добавления"
+    )
 
     class Meta:
         """Класс мета."""
@@ -315,3 +387,120 @@ class Favorite(models.Model):
     def __str__(self):
         """Метод строкового представления модели."""
         return f"{self.user} {self.recipe}"
+
+
+class FeedEntry(models.Model):
+    """Запись ленты рецептов от авторов, на которых подписан пользователь."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed",
+        verbose_name="Подписчик"
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Рецепт"
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Автор рецепта"
+    )
+    created = models.DateTimeField(
+        verbose_name="Дата публикации рецепта"
+    )
+
+    class Meta:
+        """Класс мета."""
+
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Лента подписок"
+        ordering = ("-created", "-recipe")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"], name="unique_feed_entry"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-created", "-recipe"],
+                name="feed_user_created_idx"
+            ),
+            models.Index(
+                fields=["user", "author"], name="feed_user_author_idx"
+            ),
+        ]
+
+    def __str__(self):
+        """Метод строкового представления модели."""
+        return f"{self.user} {self.recipe}"
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь"
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Ингредиент"
+    )
+    total_amount = models.IntegerField(
+        verbose_name="Количество"
+    )
+
+    class Meta:
+        """Класс мета."""
+
+        verbose_name = "Ингредиент списка покупок"
+        verbose_name_plural = "Ингредиенты списков покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_shopping_list_item"
+            )
+        ]
+
+    def __str__(self):
+        """Метод строкового представления модели."""
+        return f"{self.user} {self.ingredient}"
+
+
+class RecipeStats(models.Model):
+    """Переходы по короткой ссылке и просмотры рецепта."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+        verbose_name="Рецепт"
+    )
+    clicks = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Переходы по короткой ссылке"
+    )
+    views = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Просмотры"
+    )
+
+    class Meta:
+        """Класс мета."""
+
+        verbose_name = "Статистика рецепта"
+        verbose_name_plural = "Статистика рецептов"
+
+    def __str__(self):
+        """Метод строкового представления модели."""
+        return f"{self.recipe}"
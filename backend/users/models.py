@@ -2,9 +2,49 @@ from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 
 from django.db import models
+from django.db.models.fields.files import FieldFile
 
 
-class User(AbstractUser):
+def non_counter_fields(instance):
+    """Поля модели, кроме первичного ключа и счётчиков COUNTER_FIELDS."""
+    return [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in instance.COUNTER_FIELDS
+    ]
+
+
+class LoadedValuesMixin:
+    """Запоминает значения полей, прочитанные из базы или сохранённые."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+        }
+        for attname, value in self._loaded_values.items():
+            if isinstance(value, FieldFile):
+                self._loaded_values[attname] = value.name
+
+    def changed_fields(self, names):
+        """Поля из names, значения которых отличаются от запомненных."""
+        loaded = getattr(self, '_loaded_values', {})
+        changed = set()
+        for name in names:
+            attname = self._meta.get_field(name).attname
+            if (attname not in loaded
+                    or getattr(self, attname) != loaded[attname]):
+                changed.add(name)
+        return changed
+
+
+class User(LoadedValuesMixin, AbstractUser):
     """Модель для пользователей, созданная для приложения foodgram"""
     USER_REGEX = r'^[\w.@+-]+$'
 
@@ -37,9 +77,20 @@ class User(AbstractUser):
         blank=True,
         null=True,
         verbose_name='Аватар')
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', 'password']
+    COUNTER_FIELDS = ('recipes_count', 'followers_count')
 
     class Meta:
         """Мета-параметры"""
@@ -47,6 +98,22 @@ class User(AbstractUser):
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
         ordering = ('id',)
+        indexes = [
+            models.Index(
+                fields=['-recipes_count', 'id'],
+                name='user_recipes_count_idx'
+            ),
+            models.Index(
+                fields=['-followers_count', 'id'],
+                name='user_followers_count_idx'
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Сохраняет пользователя, не перезаписывая счётчики."""
+        if kwargs.get('update_fields') is None and not self._state.adding:
+            kwargs['update_fields'] = non_counter_fields(self)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         """Строковое представление"""